@@ -1,33 +1,844 @@
-import pandas as pd
+# pandas (e openpyxl) são importados dentro das funções que os usam, para que
+# importar este módulo ou rodar --help não pague o custo de carregá-los.
+import argparse
 from collections import Counter
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import contextlib
+import hashlib
+import io
+from datetime import date, datetime
+from decimal import ROUND_HALF_UP, Decimal
 import html
 import os
 import glob
 import re
 import json
+import time
+import unicodedata
 
-def processar_planilha_para_cotacao():
-    """Processa a planilha e agrupa itens repetidos"""
-    
-    # Ler planilha
-    df = pd.read_excel('Dartagnan.xlsx', header=None)
-    
-    # Procurar linha de cabeçalho
-    header_row = None
-    for i in range(min(10, len(df))):
-        linha = df.iloc[i].astype(str).tolist()
+class _MedicaoEtapa:
+    """Mede tempo, pico de memória e linhas de uma etapa (usada por Instrumentacao.etapa)"""
+
+    def __init__(self, instrumentacao, nome, entrada):
+        self.instrumentacao = instrumentacao
+        self.registro = {'etapa': nome, 'entrada': entrada, 'saida': None}
+
+    def __enter__(self):
+        import tracemalloc
+
+        pilha = self.instrumentacao._pilha
+        # O pico é zerado a cada etapa: a etapa externa guarda o pico visto até aqui
+        if pilha:
+            pilha[-1].pico = max(pilha[-1].pico, tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        self.memoria_inicial = tracemalloc.get_traced_memory()[0]
+        self.pico = 0
+        self.nivel = len(pilha)
+        pilha.append(self)
+        # Registrada na entrada para que a tabela siga a ordem de início (externa antes das internas)
+        self.instrumentacao.etapas.append(self.registro)
+        self.inicio = time.perf_counter()
+        return self.registro
+
+    def __exit__(self, *exc):
+        import tracemalloc
+
+        tempo = time.perf_counter() - self.inicio
+        self.pico = max(self.pico, tracemalloc.get_traced_memory()[1])
+        pilha = self.instrumentacao._pilha
+        pilha.pop()
+        if pilha:
+            pilha[-1].pico = max(pilha[-1].pico, self.pico)
+        self.registro.update(
+            tempo=tempo, pico_memoria=max(self.pico - self.memoria_inicial, 0), nivel=self.nivel
+        )
+        return False
+
+class Instrumentacao:
+    """Tempo, pico de memória (tracemalloc) e linhas de entrada/saída de cada etapa.
+
+    Desligada por padrão: etapa() devolve um contexto vazio e não mede nada.
+    """
+
+    def __init__(self):
+        self.ativa = False
+        self.etapas = []
+        self._pilha = []
+
+    def ativar(self):
+        import tracemalloc
+
+        tracemalloc.start()
+        self.ativa = True
+        self.etapas = []
+
+    def desativar(self):
+        import tracemalloc
+
+        self.ativa = False
+        tracemalloc.stop()
+
+    def etapa(self, nome, entrada=None):
+        """Contexto que mede uma etapa; o dicionário retornado aceita 'saida' e outros detalhes"""
+        if not self.ativa:
+            return contextlib.nullcontext({})
+        return _MedicaoEtapa(self, nome, entrada)
+
+    def exibir_tabela(self):
+        print(f"\n⏱️  Perfil da execução:")
+        print(f"   {'Etapa':<28} {'Tempo (s)':>10} {'Pico (MB)':>10} {'Entrada':>9} {'Saída':>9}")
+        print(f"   {'-' * 70}")
+        for etapa in self.etapas:
+            nome = '  ' * etapa['nivel'] + etapa['etapa']
+            entrada = '' if etapa['entrada'] is None else etapa['entrada']
+            saida = '' if etapa['saida'] is None else etapa['saida']
+            print(f"   {nome:<28} {etapa['tempo']:>10.3f} {etapa['pico_memoria'] / 1024 / 1024:>10.1f} "
+                  f"{entrada:>9} {saida:>9}".rstrip())
+
+    def salvar_json(self, caminho):
+        with open(caminho, 'w', encoding='utf-8') as f:
+            json.dump({'gerado_em': datetime.now().isoformat(timespec='seconds'), 'etapas': self.etapas},
+                      f, ensure_ascii=False, indent=2)
+
+# Instância usada pelas etapas do processamento (ligada com --perfil)
+instrumentacao = Instrumentacao()
+
+def _converter_celula(celula):
+    """Converte uma célula do openpyxl da mesma forma que o pd.read_excel"""
+    if celula.value is None:
+        return ''
+    if celula.data_type == 'e':
+        return float('nan')
+    if celula.data_type == 'n':
+        inteiro = int(celula.value)
+        if inteiro == celula.value:
+            return inteiro
+        return float(celula.value)
+    return celula.value
+
+def _converter_valor_calamine(valor):
+    """Converte um valor do python-calamine da mesma forma que o pd.read_excel(engine='calamine')"""
+    if isinstance(valor, float):
+        inteiro = int(valor)
+        if inteiro == valor:
+            return inteiro
+        return valor
+    if type(valor) is date:
+        return datetime(valor.year, valor.month, valor.day)
+    return valor
+
+# Números no formato brasileiro (1.234,56), comuns em CSV separado por ';'
+_RE_NUMERO_BR = re.compile(r'^-?\d{1,3}(\.\d{3})*,\d+$|^-?\d+,\d+$')
+
+def _normalizar_linhas(linhas):
+    """Remove células e linhas vazias do final e completa as linhas até a mesma largura"""
+    ultima_linha_com_dados = -1
+    for numero_linha, linha in enumerate(linhas):
+        # Remover células vazias no final da linha
+        while linha and linha[-1] == '':
+            linha.pop()
+        if linha:
+            ultima_linha_com_dados = numero_linha
+
+    # Remover linhas vazias no final da planilha
+    linhas = linhas[:ultima_linha_com_dados + 1]
+
+    # Completar linhas curtas até a largura máxima
+    if linhas:
+        largura = max(len(linha) for linha in linhas)
+        linhas = [linha + [''] * (largura - len(linha)) for linha in linhas]
+
+    return linhas
+
+EXTENSOES_OPENPYXL = ('.xlsx', '.xlsm')
+EXTENSOES_CALAMINE = ('.xlsx', '.xlsm', '.xlsb', '.xls', '.ods')
+EXTENSOES_PLANILHA = EXTENSOES_CALAMINE + ('.csv',)
+MOTORES_LEITURA = ['auto', 'calamine', 'openpyxl']
+
+class LeitorPlanilhas:
+    """Lê as linhas das planilhas (.xlsx, .xls, .ods, .csv...) com o motor mais rápido disponível.
+
+    Com motor 'auto', usa o python-calamine (em Rust) quando instalado e o
+    openpyxl caso contrário. As linhas saem no mesmo formato em qualquer motor:
+    células vazias como '', números inteiros como int.
+    """
+
+    def __init__(self, motor='auto'):
+        self.motor = motor
+
+    @staticmethod
+    def calamine_disponivel():
+        try:
+            import python_calamine  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def motor_para(self, caminho):
+        """Motor usado para ler `caminho` ('calamine', 'openpyxl' ou 'csv')"""
+        extensao = os.path.splitext(caminho)[1].lower()
+        if extensao == '.csv':
+            return 'csv'
+        motor = self.motor
+        if motor == 'auto':
+            motor = 'calamine' if self.calamine_disponivel() else 'openpyxl'
+        if motor == 'openpyxl' and extensao not in EXTENSOES_OPENPYXL:
+            if self.motor == 'openpyxl':
+                raise ValueError(f"O openpyxl não lê arquivos {extensao}; use o motor calamine")
+            raise ImportError(f"Ler arquivos {extensao} requer o pacote python-calamine "
+                              "(pip install python-calamine)")
+        return motor
+
+    def abas(self, caminho):
+        """Nomes das abas, na ordem do arquivo (um CSV tem uma única aba)"""
+        motor = self.motor_para(caminho)
+        if motor == 'csv':
+            return [os.path.splitext(os.path.basename(caminho))[0]]
+        if motor == 'calamine':
+            from python_calamine import CalamineWorkbook
+
+            return CalamineWorkbook.from_path(caminho).sheet_names
+
+        from openpyxl import load_workbook
+
+        wb = load_workbook(caminho, read_only=True)
+        try:
+            return wb.sheetnames
+        finally:
+            wb.close()
+
+    def linhas(self, caminho, aba=None):
+        """Linhas de uma aba (a primeira, por padrão), lidas uma única vez"""
+        motor = self.motor_para(caminho)
+        if motor == 'csv':
+            linhas = self._linhas_csv(caminho)
+        elif motor == 'calamine':
+            linhas = self._linhas_calamine(caminho, aba)
+        else:
+            linhas = self._linhas_openpyxl(caminho, aba)
+        return _normalizar_linhas(linhas)
+
+    @staticmethod
+    def _linhas_openpyxl(caminho, aba):
+        from openpyxl import load_workbook
+
+        # Modo read-only: o openpyxl não monta o modelo completo da pasta de trabalho, mas as
+        # linhas são guardadas numa lista (cabeçalho, layout e DataFrame saem dela), então a
+        # memória ainda cresce com o tamanho da aba. O ganho é ler o arquivo uma única vez.
+        wb = load_workbook(caminho, read_only=True, data_only=True)
+        try:
+            ws = wb.worksheets[0] if aba is None else wb[aba]
+            ws.reset_dimensions()
+            return [[_converter_celula(c) for c in linha] for linha in ws.iter_rows()]
+        finally:
+            wb.close()
+
+    @staticmethod
+    def _linhas_calamine(caminho, aba):
+        from python_calamine import CalamineWorkbook
+
+        wb = CalamineWorkbook.from_path(caminho)
+        ws = wb.get_sheet_by_index(0) if aba is None else wb.get_sheet_by_name(aba)
+        return [[_converter_valor_calamine(v) for v in linha]
+                for linha in ws.to_python(skip_empty_area=False)]
+
+    @staticmethod
+    def _linhas_csv(caminho):
+        """Linhas de um CSV como texto (os tipos são inferidos depois, pelo TextParser)"""
+        import csv
+
+        with open(caminho, 'rb') as f:
+            bruto = f.read()
+        try:
+            texto = bruto.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            texto = bruto.decode('latin-1')  # CSV exportado pelo Excel em português
+
+        try:
+            dialeto = csv.Sniffer().sniff(texto[:64 * 1024], delimiters=',;\t')
+        except csv.Error:
+            dialeto = csv.excel
+        linhas = [[celula.strip() for celula in linha] for linha in csv.reader(io.StringIO(texto), dialeto)]
+
+        if dialeto.delimiter == ';':
+            linhas = [
+                [celula.replace('.', '').replace(',', '.') if _RE_NUMERO_BR.match(celula) else celula
+                 for celula in linha]
+                for linha in linhas
+            ]
+        return linhas
+
+# Leitor usado por todo o processamento (motor escolhido com --motor)
+leitor_planilhas = LeitorPlanilhas()
+
+# Processos para ler as abas (--todas-abas); None = um por aba, até o número de núcleos
+processos_abas = None
+
+def configurar_leitura(motor='auto', pasta_layouts=None, layouts_manuais=None, processos=None):
+    """Aplica as opções de leitura (--motor, --layouts e a pasta de layouts do --cache) ao processo atual.
+
+    Também é o `initializer` dos ProcessPoolExecutor: com spawn/forkserver
+    os processos filhos não herdam o estado configurado no processo principal.
+    `processos` limita os processos da leitura das abas (1 dentro do lote,
+    que já usa um processo por planilha).
+    """
+    global processos_abas
+    processos_abas = processos
+    leitor_planilhas.motor = motor
+    layouts_planilhas.configurar(pasta_layouts,
+                                 ARQUIVO_LAYOUTS_MANUAIS if layouts_manuais is None else layouts_manuais)
+
+def _opcoes_leitura():
+    """Argumentos de configurar_leitura que reproduzem a configuração atual"""
+    return leitor_planilhas.motor, layouts_planilhas.pasta_cache, layouts_planilhas.caminho_manual, processos_abas
+
+def listar_abas(caminho):
+    """Nomes das abas da planilha, na ordem do arquivo"""
+    return leitor_planilhas.abas(caminho)
+
+def ler_linhas_planilha(caminho, aba=None):
+    """Lê as linhas de uma aba (a primeira, por padrão) uma única vez"""
+    return leitor_planilhas.linhas(caminho, aba)
+
+def localizar_linha_cabecalho(linhas, max_linhas=10, padrao=3):
+    """Procura a linha de cabeçalho ('Item' e 'Descrição') nas primeiras linhas"""
+    for i in range(min(max_linhas, len(linhas))):
+        linha = [str(v) for v in linhas[i]]
         if 'Item' in linha and 'Descrição' in linha:
-            header_row = i
-            break
-    
-    if header_row is None:
-        header_row = 3
-    
-    # Ler com cabeçalho
-    df_header = pd.read_excel('Dartagnan.xlsx', header=header_row)
-    
-    # Identificar colunas
+            return i
+    return padrao
+
+def _montar_dataframe(linhas, header_row):
+    from pandas.io.parsers import TextParser
+
+    # Mesmo parser usado pelo pd.read_excel, mas sobre as linhas já em memória
+    parser = TextParser(linhas, header=header_row, skip_blank_lines=False)
+    try:
+        return parser.read()
+    finally:
+        parser.close()
+
+def carregar_planilha(caminho='Dartagnan.xlsx'):
+    """Lê a planilha uma única vez e retorna o DataFrame já com o cabeçalho detectado"""
+    linhas = ler_linhas_planilha(caminho)
+    header_row = localizar_linha_cabecalho(linhas)
+    return _montar_dataframe(linhas, header_row)
+
+# Nas planilhas com várias abas, o cabeçalho pode estar mais abaixo (título da obra, logotipo...)
+MAX_LINHAS_CABECALHO_ABA = 50
+
+# Valores monetários em ponto fixo: inteiros em milionésimos de real. Preserva as
+# frações de centavo das células (qtd × preço não arredondado), de modo que o
+# único arredondamento ao centavo é o da exibição (formatar_reais).
+ESCALA_VALORES = 1_000_000
+
+def para_ponto_fixo(valores):
+    """Valores em reais (sequência ou array) como array int64 em milionésimos de real"""
+    import numpy as np
+
+    return np.rint(np.asarray(valores, dtype='float64') * ESCALA_VALORES).astype('int64')
+
+def somar_reais(valores):
+    """Soma exata de valores em reais (somados como inteiros em ponto fixo)"""
+    return int(para_ponto_fixo(valores).sum()) / ESCALA_VALORES
+
+def arredondar_reais(valor):
+    """Valor em reais arredondado ao centavo (metade para cima), como Decimal"""
+    return Decimal(repr(valor)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+def formatar_reais(valor):
+    """Valor em reais para exibição: 'R$ 1,234.56' (o arredondamento acontece só aqui)"""
+    return f"R$ {arredondar_reais(valor):,.2f}"
+
+class ItensBrutos:
+    """Itens brutos em colunas (arrays NumPy), com descrições e unidades internadas em códigos.
+
+    Cada item é uma posição dos arrays: `codigos` aponta para `descricoes`
+    (uma entrada por descrição distinta, na ordem em que aparecem), e
+    `codigos_unidade` para `unidades`. Com várias abas, `codigos_secao`
+    aponta para `secoes`. Os valores ficam em `valores_fixos` (int64, em
+    milionésimos de real), para que somas e médias sejam exatas. Ocupa uma fração da memória de uma lista de dicts.
+    """
+    __slots__ = ('descricoes', 'codigos', 'valores_fixos', 'quantidades', 'unidades', 'codigos_unidade',
+                 'secoes', 'codigos_secao')
+
+    def __init__(self, descricoes, codigos, valores_fixos, quantidades, unidades, codigos_unidade,
+                 secoes=None, codigos_secao=None):
+        self.descricoes = descricoes
+        self.codigos = codigos
+        self.valores_fixos = valores_fixos
+        self.quantidades = quantidades
+        self.unidades = unidades
+        self.codigos_unidade = codigos_unidade
+        self.secoes = secoes
+        self.codigos_secao = codigos_secao
+
+    @staticmethod
+    def _internar(textos):
+        """(códigos int32, valores distintos na ordem em que aparecem)"""
+        import pandas as pd
+
+        codigos, distintos = pd.factorize(pd.Series(textos, dtype=object))
+        return codigos.astype('int32'), list(distintos)
+
+    @classmethod
+    def de_colunas(cls, descricoes, valores, quantidades, unidades, secao=None):
+        """Monta a partir de sequências com um valor por item (`valores` em reais)"""
+        import numpy as np
+
+        codigos, vocabulario = cls._internar(descricoes)
+        codigos_unidade, lista_unidades = cls._internar(unidades)
+        itens = cls(vocabulario, codigos, para_ponto_fixo(valores), np.asarray(quantidades),
+                    lista_unidades, codigos_unidade)
+        if secao is not None:
+            itens.marcar_secao(secao)
+        return itens
+
+    @classmethod
+    def vazio(cls):
+        return cls.de_colunas([], [], [], [])
+
+    def __len__(self):
+        return len(self.codigos)
+
+    def marcar_secao(self, secao):
+        """Marca todos os itens como pertencentes à aba/seção `secao`"""
+        import numpy as np
+
+        self.secoes = [secao]
+        self.codigos_secao = np.zeros(len(self.codigos), dtype='int32')
+
+    def descricoes_itens(self):
+        """Descrição de cada item (array de objetos, sem copiar as strings)"""
+        import numpy as np
+
+        return np.asarray(self.descricoes + [None], dtype=object)[:-1][self.codigos]
+
+    def linhas(self):
+        """(descricao, valor em reais, unidade, quantidade) de cada item, na ordem da planilha"""
+        return zip(self.descricoes_itens().tolist(), (self.valores_fixos / ESCALA_VALORES).tolist(),
+                   [self.unidades[c] for c in self.codigos_unidade.tolist()], self.quantidades.tolist())
+
+    def para_dicts(self):
+        """Itens como lista de dicts (formato usado antes da representação em colunas)"""
+        itens = [
+            {'descricao': descricao, 'valor': valor, 'unidade': unidade, 'quantidade': quantidade}
+            for descricao, valor, unidade, quantidade in self.linhas()
+        ]
+        if self.codigos_secao is not None:
+            for item, codigo in zip(itens, self.codigos_secao.tolist()):
+                item['secao'] = self.secoes[codigo]
+        return itens
+
+    def filtrar(self, mascara):
+        """Novo ItensBrutos só com os itens em que `mascara` (array booleano) é verdadeira"""
+        return ItensBrutos(
+            self.descricoes, self.codigos[mascara], self.valores_fixos[mascara], self.quantidades[mascara],
+            self.unidades, self.codigos_unidade[mascara], self.secoes,
+            None if self.codigos_secao is None else self.codigos_secao[mascara]
+        )
+
+    def remapear_descricoes(self, mapa):
+        """Novo ItensBrutos com codigos = mapa[codigos] (mesmo vocabulário)"""
+        return ItensBrutos(self.descricoes, mapa[self.codigos], self.valores_fixos, self.quantidades,
+                           self.unidades, self.codigos_unidade, self.secoes, self.codigos_secao)
+
+    @staticmethod
+    def _juntar_vocabularios(vocabularios):
+        """Vocabulário único e, para cada vocabulário, o array que traduz seus códigos"""
+        import numpy as np
+
+        indice = {}
+        mapas = []
+        for vocabulario in vocabularios:
+            mapas.append(np.array([indice.setdefault(v, len(indice)) for v in vocabulario], dtype='int32'))
+        return list(indice), mapas
+
+    @classmethod
+    def concatenar(cls, partes):
+        """Junta vários ItensBrutos (ex.: um por aba), na ordem dada"""
+        import numpy as np
+
+        partes = [parte for parte in partes if len(parte)]
+        if not partes:
+            return cls.vazio()
+        if len(partes) == 1:
+            return partes[0]
+
+        descricoes, mapas_desc = cls._juntar_vocabularios([p.descricoes for p in partes])
+        unidades, mapas_unid = cls._juntar_vocabularios([p.unidades for p in partes])
+        itens = cls(
+            descricoes,
+            np.concatenate([m[p.codigos] for m, p in zip(mapas_desc, partes)]),
+            np.concatenate([p.valores_fixos for p in partes]),
+            np.concatenate([p.quantidades for p in partes]),
+            unidades,
+            np.concatenate([m[p.codigos_unidade] for m, p in zip(mapas_unid, partes)]),
+        )
+        if all(p.codigos_secao is not None for p in partes):
+            itens.secoes, mapas_secao = cls._juntar_vocabularios([p.secoes for p in partes])
+            itens.codigos_secao = np.concatenate([m[p.codigos_secao] for m, p in zip(mapas_secao, partes)])
+        return itens
+
+def extrair_itens(df_header, col_descricao, col_total, col_unidade, col_quantidade):
+    """Extrai os itens brutos (ItensBrutos) e a contagem de todas as descrições com operações por coluna"""
+    import pandas as pd
+
+    # Descrições válidas: não nulas, sem cabeçalhos/valores inválidos e sem linhas de total
+    descricoes = df_header[col_descricao]
+    descricoes = descricoes[descricoes.notna()].astype(str).str.strip()
+    desc_lower = descricoes.str.lower()
+    mascara_desc = ~desc_lower.isin(['descrição', 'descricao', 'obra', 'nan', ''])
+    mascara_desc &= ~(desc_lower.str.contains('total', regex=False) |
+                      desc_lower.str.contains('geral', regex=False))
+    descricoes = descricoes[mascara_desc]
+
+    # Contar TODAS as ocorrências na planilha (incluindo as com valor zero ou NaN)
+    contador_todos = Counter(descricoes.tolist())
+
+    # Unidade e quantidade precisam estar preenchidas
+    if not col_unidade or not col_quantidade:
+        return ItensBrutos.vazio(), contador_todos
+
+    linhas = descricoes.index
+    unidades = df_header.loc[linhas, col_unidade]
+    unidades_validas = unidades.notna()
+    unidades = unidades[unidades_validas].astype(str).str.strip()
+    unidades_validas[unidades_validas] = ~unidades.str.lower().isin(['nan', 'none', '', 'undefined'])
+
+    quantidades = pd.to_numeric(df_header.loc[linhas, col_quantidade], errors='coerce')
+    quantidades_validas = quantidades.notna()
+
+    # Obter valor (tratar NaN e textos como 0)
+    valores = pd.to_numeric(df_header.loc[linhas, col_total], errors='coerce').fillna(0)
+
+    # Adicionar apenas itens com unidade E quantidade válidas
+    mascara = unidades_validas & quantidades_validas
+    linhas = linhas[mascara.to_numpy()]
+    todos_itens_raw = ItensBrutos.de_colunas(
+        descricoes.loc[linhas].to_numpy(dtype=object),
+        valores.loc[linhas].to_numpy(),
+        quantidades.loc[linhas].to_numpy(),
+        unidades.loc[linhas].to_numpy(dtype=object),
+    )
+
+    return todos_itens_raw, contador_todos
+
+def agrupar_itens(itens, contador_todos):
+    """Agrupa os itens filtrados (ItensBrutos) por código de descrição, com operações vetorizadas"""
+    import numpy as np
+
+    if not len(itens):
+        return []
+
+    codigos = itens.codigos
+
+    # Grupos na ordem em que cada descrição aparece pela primeira vez
+    distintos, primeira_posicao, ocorrencias = np.unique(codigos, return_index=True, return_counts=True)
+    ordem = np.argsort(codigos, kind='stable')  # Posições de cada grupo, na ordem da planilha
+    inicios = np.concatenate(([0], np.cumsum(ocorrencias)[:-1]))
+
+    # Total (ponto fixo) e número de valores > 0 de cada grupo (somas inteiras, exatas)
+    ordem_valor = ordem[itens.valores_fixos[ordem] > 0]
+    codigos_valor, inicios_valor, contagens_valor = np.unique(
+        codigos[ordem_valor], return_index=True, return_counts=True
+    )
+    totais = np.add.reduceat(itens.valores_fixos[ordem_valor], inicios_valor) if len(ordem_valor) else []
+    valores_por_codigo = dict(zip(codigos_valor.tolist(),
+                                  zip(np.asarray(totais).tolist(), inicios_valor.tolist(), contagens_valor.tolist())))
+
+    # Unidade mais frequente de cada grupo (em caso de empate, a que aparece primeiro)
+    total_unidades = max(len(itens.unidades), 1)
+    pares, primeira_par, contagem_par = np.unique(
+        codigos.astype('int64') * total_unidades + itens.codigos_unidade,
+        return_index=True, return_counts=True
+    )
+    codigo_par = pares // total_unidades
+    preferencia = np.lexsort((primeira_par, -contagem_par, codigo_par))
+    codigo_ordenado = codigo_par[preferencia]
+    melhor = np.concatenate(([True], codigo_ordenado[1:] != codigo_ordenado[:-1]))
+    unidade_por_codigo = dict(zip(codigo_ordenado[melhor].tolist(),
+                                  (pares[preferencia][melhor] % total_unidades).tolist()))
+
+    # Criar lista agrupada
+    itens_agrupados = []
+    for g in np.argsort(primeira_posicao, kind='stable').tolist():
+        codigo = int(distintos[g])
+        # Pular se não há valores > 0 (itens com valor 0/NaN não formam grupo)
+        if codigo not in valores_por_codigo:
+            continue
+
+        total_fixo, inicio_valor, n_valores = valores_por_codigo[codigo]
+        posicoes = ordem[inicios[g]:inicios[g] + ocorrencias[g]]
+        posicoes_valor = ordem_valor[inicio_valor:inicio_valor + n_valores]
+        descricao = itens.descricoes[codigo]
+        # Reais só na saída; a média não é arredondada (isso fica para a formatação)
+        valor_total = total_fixo / ESCALA_VALORES
+        valor_medio = total_fixo / (ESCALA_VALORES * n_valores)
+
+        itens_agrupados.append({
+            'descricao': descricao,
+            # Número real de vezes que aparece na planilha (incluindo as com valor 0)
+            'quantidade': contador_todos.get(descricao, int(ocorrencias[g])),
+            'quantidade_total': sum(itens.quantidades[posicoes].tolist()),  # Soma das quantidades
+            'unidade': itens.unidades[unidade_por_codigo[codigo]],
+            'valor_total': valor_total,
+            'valor_unitario': valor_medio,
+            'valores': (itens.valores_fixos[posicoes_valor] / ESCALA_VALORES).tolist()
+        })
+        if itens.codigos_secao is not None:
+            # Subtotal por aba/seção, em ponto fixo
+            secoes = {}
+            for secao, valor in zip(itens.codigos_secao[posicoes_valor].tolist(),
+                                    itens.valores_fixos[posicoes_valor].tolist()):
+                secoes[itens.secoes[secao]] = secoes.get(itens.secoes[secao], 0) + valor
+            itens_agrupados[-1]['secoes'] = {secao: valor / ESCALA_VALORES for secao, valor in secoes.items()}
+
+    # Ordenar por quantidade (mais repetidos primeiro)
+    itens_agrupados.sort(key=lambda x: x['quantidade'], reverse=True)
+
+    return itens_agrupados
+
+CATEGORIAS_GENERICAS = frozenset([
+    'esquadrias', 'piso', 'revestimento', 'louças', 'acessórios',
+    'metais', 'vidro', 'diversos', 'área', 'reforma', 'sala',
+    'banheiro', 'depósito', 'hall', 'barrilete', 'bombas',
+    'quadro', 'comando', 'escada', 'acesso', 'execução',
+    'elevatória', 'água', 'bruta', 'bate', 'estaca',
+    'sistema', 'cloração', 'eta', 'nova', 'oficina',
+    'hidrômetros', 'pitometria', 'almoxarifado', 'estação',
+    'tratamento', 'casa', 'química', 'laboratório', 'guarita',
+    'administração', 'local', 'serviços', 'preliminares'
+])
+
+# Motivos retornados pelo classificador
+MOTIVO_MANTIDO = 'mantido'
+MOTIVO_CATEGORIA = 'categoria_generica'
+MOTIVO_LISTA_CATEGORIAS = 'lista_de_categorias'
+MOTIVO_SEM_VALOR = 'sem_valor'
+MOTIVO_SEM_DETALHES = 'sem_detalhes'
+
+def _regex_marcadores(marcadores):
+    return re.compile('|'.join(re.escape(m) for m in marcadores))
+
+class ClassificadorItens:
+    """Heurísticas que separam itens finais de categorias/títulos da planilha"""
+
+    def __init__(self, categorias=CATEGORIAS_GENERICAS):
+        self.categorias = frozenset(categorias)
+        # Uma regex por família de marcadores (aplicadas sobre a descrição em maiúsculas)
+        self.re_especificacao_lista = _regex_marcadores(['AF_', 'NBR', 'CM', 'MM', 'X', 'DE', 'PARA'])
+        self.re_codigo_tecnico = _regex_marcadores(['AF_', 'NBR'])
+        self.re_dimensoes = _regex_marcadores(['CM', 'MM', 'X', 'M²', 'M2'])
+
+    def motivo_descricao(self, desc):
+        """Avalia as regras que dependem só da descrição.
+
+        Retorna o motivo de descarte ou None quando a descrição é de um item
+        final (e deve ser mantida se tiver valor > 0).
+        """
+        desc_lower = desc.lower()
+        palavras_desc = desc_lower.split()
+
+        # Categoria genérica de UMA palavra. Exemplos: "Piso", "Vidro", "Esquadrias"
+        if len(palavras_desc) == 1 and len(desc) < 20 and desc_lower in self.categorias:
+            return MOTIVO_CATEGORIA
+
+        desc_upper = desc.upper()
+
+        # Apenas lista de categorias separadas por vírgula (sem especificações)
+        if ',' in desc and len(palavras_desc) <= 5:
+            todas_categorias = all(
+                p.lower() in self.categorias
+                for p in (p.strip() for p in desc.split(','))
+                if len(p) > 2
+            )
+            if todas_categorias and not self.re_especificacao_lista.search(desc_upper):
+                return MOTIVO_LISTA_CATEGORIAS
+
+        # Item final: código técnico, descrição detalhada, especificações (dimensões)
+        # ou item principal (mais de 2 palavras ou mais de 30 caracteres)
+        if (self.re_codigo_tecnico.search(desc_upper) or len(desc) > 50
+                or self.re_dimensoes.search(desc_upper)
+                or len(palavras_desc) > 2 or len(desc) > 30):
+            return None
+
+        return MOTIVO_SEM_DETALHES
+
+    def classificar_item(self, desc, valor):
+        """Retorna (manter, motivo) para um único item"""
+        motivo = self.motivo_descricao(desc)
+        if motivo in (MOTIVO_CATEGORIA, MOTIVO_LISTA_CATEGORIAS):
+            return False, motivo
+        if not valor > 0:
+            return False, MOTIVO_SEM_VALOR
+        if motivo is not None:
+            return False, motivo
+        return True, MOTIVO_MANTIDO
+
+    def classificar(self, descricoes, valores=None):
+        """Classifica uma Series de descrições (e valores) de uma vez.
+
+        As regras de texto são avaliadas uma vez por descrição distinta.
+        Retorna (mascara, motivos): Series booleana de itens mantidos e Series
+        com o motivo de cada decisão, ambas com o índice de `descricoes`.
+        """
+        import pandas as pd
+
+        if valores is None:
+            valores = pd.Series(1.0, index=descricoes.index)
+
+        distintas = pd.unique(descricoes)
+        motivos_desc = pd.Series(
+            [self.motivo_descricao(desc) for desc in distintas], index=distintas, dtype=object
+        )
+        motivos = descricoes.map(motivos_desc).astype(object)
+        return self._decidir(motivos, valores.gt(0).to_numpy())
+
+    def classificar_brutos(self, itens):
+        """Como classificar, para um ItensBrutos: as regras rodam uma vez por código de descrição.
+
+        Retorna (mascara, motivos): array booleano e Series com o motivo de cada item.
+        """
+        import numpy as np
+        import pandas as pd
+
+        motivos_desc = np.array([self.motivo_descricao(desc) for desc in itens.descricoes] + [None],
+                                dtype=object)[:-1]
+        motivos = pd.Series(motivos_desc[itens.codigos], dtype=object)
+        mascara, motivos = self._decidir(motivos, itens.valores_fixos > 0)
+        return mascara.to_numpy(), motivos
+
+    @staticmethod
+    def _decidir(motivos, com_valor):
+        """Combina o motivo da descrição com o valor de cada item: (mascara, motivos)"""
+        import pandas as pd
+
+        e_categoria = motivos.isin([MOTIVO_CATEGORIA, MOTIVO_LISTA_CATEGORIAS]).to_numpy()
+        e_item_final = motivos.isna().to_numpy()
+
+        motivos = motivos.where(e_categoria | com_valor, MOTIVO_SEM_VALOR)
+        mascara = pd.Series(e_item_final & com_valor, index=motivos.index)
+        motivos = motivos.where(~mascara, MOTIVO_MANTIDO)
+
+        return mascara, motivos
+
+classificador_itens = ClassificadorItens()
+
+LIMIAR_SIMILARIDADE = 0.9
+
+def chave_similaridade(descricao):
+    """Descrição reduzida às palavras normalizadas (ignora espaços, caixa, acentos e pontuação)"""
+    return ' '.join(tokens_busca(descricao))
+
+def _assinatura_numeros(chave):
+    # Descrições com números diferentes (bitolas, dimensões, códigos AF_) nunca são fundidas
+    return tuple(sorted(re.findall(r'\d+', chave)))
+
+def agrupar_descricoes_similares(descricoes, limiar=LIMIAR_SIMILARIDADE, palavras_bloco=3):
+    """Agrupa descrições quase iguais sem comparar todos os pares.
+
+    Primeiro une as descrições com a mesma chave_similaridade. Depois, cada
+    chave entra nos blocos (números da descrição + palavra) das suas
+    `palavras_bloco` palavras mais raras, e só chaves que dividem um bloco são
+    comparadas (difflib, razão >= `limiar`). Retorna a lista de grupos, cada um
+    com as descrições originais na ordem em que foram vistas.
+    """
+    from difflib import SequenceMatcher
+
+    por_chave = {}
+    for descricao in descricoes:
+        por_chave.setdefault(chave_similaridade(descricao), []).append(descricao)
+    chaves = list(por_chave)
+
+    # Frequência de cada palavra entre as chaves distintas (palavras raras formam blocos pequenos)
+    frequencia = Counter(palavra for chave in chaves for palavra in set(chave.split()))
+    blocos = {}
+    for i, chave in enumerate(chaves):
+        numeros = _assinatura_numeros(chave)
+        palavras = sorted({p for p in chave.split() if not p.isdigit()},
+                          key=lambda p: (frequencia[p], p))
+        for palavra in palavras[:palavras_bloco] or ['']:
+            blocos.setdefault((numeros, palavra), []).append(i)
+
+    # Union-find sobre os índices das chaves
+    pai = list(range(len(chaves)))
+
+    def raiz(i):
+        while pai[i] != i:
+            pai[i] = pai[pai[i]]
+            i = pai[i]
+        return i
+
+    comparados = set()
+    for indices in blocos.values():
+        for a in range(len(indices)):
+            for b in range(a + 1, len(indices)):
+                i, j = indices[a], indices[b]
+                if (i, j) in comparados or raiz(i) == raiz(j):
+                    continue
+                comparados.add((i, j))
+                comparador = SequenceMatcher(None, chaves[i], chaves[j], autojunk=False)
+                if (comparador.real_quick_ratio() >= limiar and comparador.quick_ratio() >= limiar
+                        and comparador.ratio() >= limiar):
+                    pai[raiz(j)] = raiz(i)
+
+    grupos = {}
+    for i, chave in enumerate(chaves):
+        grupos.setdefault(raiz(i), []).extend(por_chave[chave])
+    return list(grupos.values())
+
+def fundir_itens_similares(itens, contador_todos, limiar=LIMIAR_SIMILARIDADE):
+    """Reescreve descrições quase iguais para uma descrição canônica antes do agrupamento.
+
+    A canônica de cada grupo é a variante mais frequente na planilha (em caso
+    de empate, a que aparece primeiro). `itens` é um ItensBrutos; as
+    descrições fundidas passam a usar o código da canônica. Retorna
+    (itens, contador_todos, fusoes), onde fusoes é
+    {descricao_canonica: [variantes fundidas]}.
+    """
+    import numpy as np
+
+    # Descrições presentes nos itens, na ordem em que aparecem
+    presentes, primeira_posicao = np.unique(itens.codigos, return_index=True)
+    presentes = presentes[np.argsort(primeira_posicao, kind='stable')].tolist()
+    descricoes = [itens.descricoes[codigo] for codigo in presentes]
+    codigo_de = dict(zip(descricoes, presentes))
+    canonica = {}
+    fusoes = {}
+    for grupo in agrupar_descricoes_similares(descricoes, limiar):
+        if len(grupo) < 2:
+            continue
+        principal = max(grupo, key=lambda d: contador_todos.get(d, 0))
+        fusoes[principal] = [d for d in grupo if d != principal]
+        for descricao in grupo:
+            canonica[descricao] = principal
+
+    if not fusoes:
+        return itens, contador_todos, fusoes
+
+    mapa = np.arange(len(itens.descricoes), dtype=itens.codigos.dtype)
+    for descricao, principal in canonica.items():
+        mapa[codigo_de[descricao]] = codigo_de[principal]
+    itens = itens.remapear_descricoes(mapa)
+    contador_fundido = Counter()
+    for descricao, quantidade in contador_todos.items():
+        contador_fundido[canonica.get(descricao, descricao)] += quantidade
+    return itens, contador_fundido, fusoes
+
+def exibir_fusoes(fusoes, limite=10):
+    """Imprime as variantes de descrição que foram fundidas"""
+    total = sum(len(variantes) for variantes in fusoes.values())
+    print(f"🔗 Descrições similares fundidas: {total} variante(s) em {len(fusoes)} item(ns)")
+    for principal, variantes in list(fusoes.items())[:limite]:
+        print(f"   {principal[:60]}")
+        for variante in variantes:
+            print(f"     ← {variante[:60]!r}")
+    if len(fusoes) > limite:
+        print(f"   ... e mais {len(fusoes) - limite} item(ns)")
+
+def identificar_colunas(df_header):
+    """Retorna (col_descricao, col_total, col_unidade, col_quantidade) pelo nome das colunas"""
     col_descricao = None
     col_total = None
     col_unidade = None
@@ -53,6 +864,180 @@ def processar_planilha_para_cotacao():
     
     if col_total is None:
         col_total = df_header.columns[-1]
+
+    return col_descricao, col_total, col_unidade, col_quantidade
+
+ARQUIVO_LAYOUTS_MANUAIS = 'layouts_planilhas.json'
+CHAVES_COLUNAS = ('descricao', 'total', 'unidade', 'quantidade')
+_RE_IMPRESSAO = re.compile(r'[0-9a-f]{16}')
+
+class LayoutsPlanilhas:
+    """Layouts (linha do cabeçalho e colunas) dos modelos de planilha já vistos.
+
+    Cada modelo é reconhecido por uma impressão digital das linhas de título
+    e cabeçalho (células com texto ou vazias) e da largura da planilha, que
+    se repetem de um mês para o outro. Com `pasta_cache`, layouts
+    detectados são guardados (um JSON por impressão digital, então processos
+    em paralelo não apagam os layouts uns dos outros) para pular a detecção
+    nas próximas planilhas do mesmo modelo. O arquivo manual (`caminho_manual`) corrige modelos que a
+    detecção erra; suas chaves são impressões digitais ou padrões de nome de
+    arquivo (ex.: "Dartagnan*.xlsx"). `linha_cabecalho` é a linha do Excel (1 = primeira).
+    """
+
+    def __init__(self, pasta_cache=None, caminho_manual=ARQUIVO_LAYOUTS_MANUAIS):
+        self.configurar(pasta_cache, caminho_manual)
+
+    def configurar(self, pasta_cache=None, caminho_manual=ARQUIVO_LAYOUTS_MANUAIS):
+        self.pasta_cache = pasta_cache
+        self.caminho_manual = caminho_manual
+        self._manuais = None
+        self._cache = {}
+
+    def _caminho_layout(self, impressao):
+        return os.path.join(self.pasta_cache, f'{impressao}.json')
+
+    @staticmethod
+    def impressao(linhas, max_linhas=10):
+        """Impressão digital do modelo: largura e tipo das células das linhas iniciais.
+
+        Considera só as linhas antes da primeira com números (títulos e
+        cabeçalho), que não mudam de uma medição para outra.
+        """
+        tipos = []
+        for linha in linhas[:max_linhas]:
+            if any(v != '' and not isinstance(v, str) for v in linha):
+                break
+            tipos.append(''.join('-' if v == '' else 't' for v in linha))
+        largura = len(linhas[0]) if linhas else 0
+        return hashlib.sha256(f'{largura}|{"|".join(tipos)}'.encode()).hexdigest()[:16]
+
+    @staticmethod
+    def _ler_json(caminho):
+        try:
+            with open(caminho, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _layouts_manuais(self):
+        if self._manuais is None:
+            self._manuais = self._ler_json(self.caminho_manual) if self.caminho_manual else {}
+        return self._manuais
+
+    def assinatura_manual(self, caminho_planilha):
+        """Hash das entradas do arquivo manual que podem valer para a planilha ('' se nenhuma).
+
+        Entra nas chaves do cache de resultados e do armazém: corrigir um layout
+        no arquivo manual invalida o que foi extraído com o layout anterior.
+        Entradas por impressão digital só se resolvem lendo a planilha, então
+        todas elas contam; entradas por nome, só as que casam com o arquivo.
+        """
+        import fnmatch
+
+        nome = os.path.basename(caminho_planilha)
+        relevantes = {chave: layout for chave, layout in self._layouts_manuais().items()
+                      if _RE_IMPRESSAO.fullmatch(chave) or fnmatch.fnmatch(nome, chave)}
+        if not relevantes:
+            return ''
+        return hashlib.sha256(json.dumps(relevantes, sort_keys=True).encode()).hexdigest()[:16]
+
+    def obter(self, caminho_planilha, impressao):
+        """Layout conhecido para a planilha, como (origem, layout), ou (None, None)"""
+        import fnmatch
+
+        self._layouts_manuais()
+        if impressao in self._manuais:
+            return 'manual', self._manuais[impressao]
+        nome = os.path.basename(caminho_planilha)
+        for padrao, layout in self._manuais.items():
+            if fnmatch.fnmatch(nome, padrao):
+                return 'manual', layout
+
+        if self.pasta_cache:
+            if impressao not in self._cache:
+                self._cache[impressao] = self._ler_json(self._caminho_layout(impressao)) or None
+            if self._cache[impressao] is not None:
+                return 'cache', self._cache[impressao]
+        return None, None
+
+    def salvar(self, impressao, header_row, colunas):
+        """Guarda o layout detectado (apenas com pasta_cache)"""
+        if not self.pasta_cache:
+            return
+        self._cache[impressao] = {
+            'linha_cabecalho': header_row + 1,
+            'colunas': {chave: None if col is None else str(col) for chave, col in zip(CHAVES_COLUNAS, colunas)},
+        }
+        os.makedirs(self.pasta_cache, exist_ok=True)
+        caminho = self._caminho_layout(impressao)
+        temporario = f'{caminho}.{os.getpid()}.tmp'
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(self._cache[impressao], f, ensure_ascii=False, indent=1)
+        os.replace(temporario, caminho)
+
+    @staticmethod
+    def aplicar(layout, linhas):
+        """(df_header, colunas) segundo o layout, ou None se ele não serve para estas linhas"""
+        header_row = int(layout.get('linha_cabecalho', 0)) - 1
+        if not 0 <= header_row < len(linhas):
+            return None
+        df_header = _montar_dataframe(linhas, header_row)
+        if 'colunas' not in layout:
+            return df_header, identificar_colunas(df_header)
+
+        por_nome = {str(col): col for col in df_header.columns}
+        colunas = []
+        for chave in CHAVES_COLUNAS:
+            nome = layout['colunas'].get(chave)
+            if nome is not None and nome not in por_nome:
+                return None  # Coluna do layout não existe nesta planilha: detectar de novo
+            colunas.append(None if nome is None else por_nome[nome])
+        if colunas[0] is None or colunas[1] is None:
+            return None
+        return df_header, tuple(colunas)
+
+# Layouts usados pela leitura (cache ligado com --cache, configurado por configurar_leitura)
+layouts_planilhas = LayoutsPlanilhas()
+
+def detectar_layout(caminho, linhas, max_linhas=10, padrao=3):
+    """Monta o DataFrame e identifica as colunas, reaproveitando o layout do modelo quando conhecido.
+
+    Retorna (df_header, colunas, origem, novo_layout): origem é 'manual',
+    'cache' ou 'detectado'; novo_layout é (impressao, header_row, colunas) a
+    guardar com layouts_planilhas.salvar, ou None. df_header é None quando
+    não há cabeçalho nas primeiras `max_linhas` linhas e `padrao` é None.
+    """
+    impressao = layouts_planilhas.impressao(linhas)
+    origem, layout = layouts_planilhas.obter(caminho, impressao)
+    if layout is not None:
+        aplicado = layouts_planilhas.aplicar(layout, linhas)
+        if aplicado is not None:
+            return aplicado[0], aplicado[1], origem, None
+        if origem == 'manual':
+            print(f"⚠️  Layout manual de {os.path.basename(caminho)} não confere com a planilha; detectando")
+
+    header_row = localizar_linha_cabecalho(linhas, max_linhas, padrao)
+    if header_row is None:
+        return None, None, 'detectado', None
+    df_header = _montar_dataframe(linhas, header_row)
+    colunas = identificar_colunas(df_header)
+    return df_header, colunas, 'detectado', (impressao, header_row, colunas)
+
+def extrair_itens_planilha(caminho):
+    """Lê a planilha e retorna (todos_itens_raw, contador_todos), antes de filtros e agrupamento"""
+    # Ler planilha (uma única leitura, cabeçalho detectado em memória)
+    with instrumentacao.etapa('leitura_planilha') as etapa:
+        etapa['motor'] = leitor_planilhas.motor_para(caminho)
+        linhas = ler_linhas_planilha(caminho)
+        etapa['saida'] = len(linhas)
+
+    # Identificar cabeçalho e colunas (ou usar o layout já conhecido do modelo)
+    with instrumentacao.etapa('layout', len(linhas)) as etapa:
+        df_header, colunas, etapa['origem'], novo_layout = detectar_layout(caminho, linhas)
+        if novo_layout is not None:
+            layouts_planilhas.salvar(*novo_layout)
+        etapa['saida'] = len(df_header)
+    col_descricao, col_total, col_unidade, col_quantidade = colunas
     
     print(f"Colunas identificadas:")
     print(f"  Descrição: {col_descricao}")
@@ -60,222 +1045,668 @@ def processar_planilha_para_cotacao():
     print(f"  Quantidade: {col_quantidade}")
     print(f"  Total: {col_total}")
     
-    # Coletar TODOS os itens primeiro (sem filtros)
-    todos_itens_raw = []
-    
-    for idx, row in df_header.iterrows():
-        desc_val = row[col_descricao] if pd.notna(row[col_descricao]) else None
-        total_val = row[col_total] if pd.notna(row[col_total]) else None
-        unidade_val = row[col_unidade] if col_unidade and pd.notna(row[col_unidade]) else None
-        quantidade_val = row[col_quantidade] if col_quantidade and pd.notna(row[col_quantidade]) else None
-        
-        if pd.isna(desc_val):
-            continue
-        
-        desc_str = str(desc_val).strip()
-        
-        # Pular cabeçalhos e valores inválidos
-        if desc_str.lower() in ['descrição', 'descricao', 'obra', 'nan', '']:
-            continue
-        
-        # Pular linhas de total
-        if 'total' in desc_str.lower() or 'geral' in desc_str.lower():
-            continue
-        
-        # Obter valor (tratar NaN como 0)
-        valor = 0
-        if pd.notna(total_val):
-            try:
-                valor = float(total_val)
-                if pd.isna(valor):
-                    valor = 0
-            except:
-                valor = 0
-        
-        # Obter unidade e quantidade
-        unidade = str(unidade_val).strip() if pd.notna(unidade_val) else None
-        quantidade = None
-        if pd.notna(quantidade_val):
-            try:
-                quantidade = float(quantidade_val)
-                if pd.isna(quantidade):
-                    quantidade = None
-            except:
-                quantidade = None
-        
-        # Verificar se unidade ou quantidade estão em branco
-        unidade_valida = unidade and unidade.lower() not in ['nan', 'none', '', 'undefined']
-        quantidade_valida = quantidade is not None and not pd.isna(quantidade)
-        
-        # Adicionar apenas itens com unidade E quantidade válidas
-        if unidade_valida and quantidade_valida:
-            todos_itens_raw.append({
-                'descricao': desc_str,
-                'valor': valor,
-                'unidade': unidade,
-                'quantidade': quantidade
-            })
-    
-    # Contar TODAS as ocorrências na planilha (incluindo as com valor zero ou NaN)
-    # Para isso, precisamos contar antes de filtrar por valor
-    todas_descricoes_planilha = []
-    for idx, row in df_header.iterrows():
-        desc_val = row[col_descricao] if pd.notna(row[col_descricao]) else None
-        if pd.isna(desc_val):
+    # Coletar TODOS os itens (sem filtros) e contar todas as ocorrências numa única passada
+    with instrumentacao.etapa('extracao_itens', len(df_header)) as etapa:
+        todos_itens_raw, contador_todos = extrair_itens(
+            df_header, col_descricao, col_total, col_unidade, col_quantidade)
+        etapa['saida'] = len(todos_itens_raw)
+    return todos_itens_raw, contador_todos
+
+def extrair_itens_aba(caminho, aba):
+    """Extrai os itens brutos de uma aba, marcados com 'secao' = nome da aba.
+
+    Retorna (colunas, todos_itens_raw, contador_todos, novo_layout), ou None
+    se a aba não tem cabeçalho de itens. Executada em um processo separado
+    por aba: o layout detectado é devolvido para ser guardado pelo processo
+    principal.
+    """
+    linhas = ler_linhas_planilha(caminho, aba)
+    df_header, colunas, _, novo_layout = detectar_layout(caminho, linhas, MAX_LINHAS_CABECALHO_ABA, padrao=None)
+    if df_header is None:
+        return None
+    todos_itens_raw, contador_todos = extrair_itens(df_header, *colunas)
+    todos_itens_raw.marcar_secao(aba)
+    return colunas, todos_itens_raw, contador_todos, novo_layout
+
+def extrair_itens_abas(caminho, abas=None, processos=None):
+    """Extrai os itens de várias abas (todas, por padrão) em paralelo.
+
+    Retorna {aba: (todos_itens_raw, contador_todos)} na ordem das abas; abas
+    sem cabeçalho de itens ficam vazias. Sem `processos`, vale o configurado
+    em configurar_leitura.
+    """
+    if abas is None:
+        abas = listar_abas(caminho)
+    if processos is None:
+        processos = processos_abas
+
+    # Ler cada aba é CPU-bound (openpyxl em Python puro): um processo por aba
+    with instrumentacao.etapa('leitura_abas', len(abas)) as etapa:
+        if len(abas) > 1 and processos != 1:
+            with ProcessPoolExecutor(max_workers=processos or min(len(abas), os.cpu_count() or 1),
+                                     initializer=configurar_leitura, initargs=_opcoes_leitura()) as executor:
+                resultados = list(executor.map(extrair_itens_aba, [caminho] * len(abas), abas))
+        else:
+            resultados = [extrair_itens_aba(caminho, aba) for aba in abas]
+        etapa['saida'] = sum(len(resultado[1]) for resultado in resultados if resultado is not None)
+
+    por_aba = {}
+    for aba, resultado in zip(abas, resultados):
+        if resultado is None:
+            print(f"⚠️  Aba '{aba}' sem cabeçalho ('Item' e 'Descrição'), ignorada")
+            por_aba[aba] = (ItensBrutos.vazio(), Counter())
             continue
-        desc_str = str(desc_val).strip()
-        if desc_str.lower() not in ['descrição', 'descricao', 'obra', 'nan', '']:
-            if 'total' not in desc_str.lower() and 'geral' not in desc_str.lower():
-                todas_descricoes_planilha.append(desc_str)
-    
-    contador_todos = Counter(todas_descricoes_planilha)
-    
+        (col_descricao, col_total, col_unidade, col_quantidade), todos_itens_raw, contador_todos, novo_layout = resultado
+        if novo_layout is not None:
+            layouts_planilhas.salvar(*novo_layout)
+        print(f"📄 Aba '{aba}': {len(todos_itens_raw)} itens (Descrição: {col_descricao}, "
+              f"Unidade: {col_unidade}, Quantidade: {col_quantidade}, Total: {col_total})")
+        por_aba[aba] = (todos_itens_raw, contador_todos)
+    return por_aba
+
+def consolidar_abas(por_aba):
+    """Junta os itens brutos de todas as abas em um único (todos_itens_raw, contador_todos)"""
+    contador_todos = Counter()
+    for _, contador_aba in por_aba.values():
+        contador_todos.update(contador_aba)
+    todos_itens_raw = ItensBrutos.concatenar([itens_aba for itens_aba, _ in por_aba.values()])
+    return todos_itens_raw, contador_todos
+
+def filtrar_e_agrupar(todos_itens_raw, contador_todos, fundir_similares=None):
+    """Aplica os filtros e agrupa os itens brutos extraídos da planilha.
+
+    Com `fundir_similares` (limiar de similaridade, ex.: 0.9), descrições quase
+    iguais são fundidas antes do agrupamento e cada item agrupado que absorveu
+    variantes ganha a chave 'variantes'.
+    """
     # Filtrar: manter itens que se repetem OU são itens finais detalhados
-    itens = []
-    categorias_genericas = [
-        'esquadrias', 'piso', 'revestimento', 'louças', 'acessórios', 
-        'metais', 'vidro', 'diversos', 'área', 'reforma', 'sala',
-        'banheiro', 'depósito', 'hall', 'barrilete', 'bombas',
-        'quadro', 'comando', 'escada', 'acesso', 'execução',
-        'elevatória', 'água', 'bruta', 'bate', 'estaca', 
-        'sistema', 'cloração', 'eta', 'nova', 'oficina', 
-        'hidrômetros', 'pitometria', 'almoxarifado', 'estação', 
-        'tratamento', 'casa', 'química', 'laboratório', 'guarita', 
-        'administração', 'local', 'serviços', 'preliminares'
-    ]
+    with instrumentacao.etapa('filtro_classificador', len(todos_itens_raw)) as etapa:
+        mascara, motivos = classificador_itens.classificar_brutos(todos_itens_raw)
+        itens = todos_itens_raw.filtrar(mascara)
+        etapa['saida'] = len(itens)
+        if instrumentacao.ativa:
+            etapa['descartes'] = motivos[~mascara].value_counts().to_dict()
     
-    for item in todos_itens_raw:
-        desc = item['descricao']
-        desc_lower = desc.lower()
-        palavras_desc = desc_lower.split()
-        
-        # Verificar se é categoria genérica de UMA palavra (pular apenas essas)
-        # Exemplos: "Piso", "Vidro", "Esquadrias" (uma palavra só)
-        if len(palavras_desc) == 1 and len(desc) < 20:
-            if desc_lower in categorias_genericas:
-                continue  # Pular apenas categorias de uma palavra
-        
-        # Verificar se é apenas lista de categorias separadas por vírgula (sem especificações)
-        if ',' in desc and len(palavras_desc) <= 5:
-            palavras_separadas = [p.strip() for p in desc.split(',')]
-            # Se todas as palavras são categorias genéricas E não tem especificações técnicas
-            todas_categorias = all(p.lower() in categorias_genericas for p in palavras_separadas if len(p) > 2)
-            tem_especificacao = any(marker in desc.upper() for marker in ['AF_', 'NBR', 'CM', 'MM', 'X', 'DE', 'PARA'])
-            if todas_categorias and not tem_especificacao:
-                continue  # Pular listas de categorias sem especificações
-        
-        # Se tem valor > 0, incluir (tanto repetidos quanto únicos)
-        if item['valor'] > 0:
-            # Verificar se é item final (tem código técnico, descrição detalhada, ou é item principal)
-            tem_codigo_tecnico = any(marker in desc.upper() for marker in ['AF_', 'NBR'])
-            tem_descricao_detalhada = len(desc) > 50
-            tem_especificacoes = any(marker in desc.upper() for marker in ['CM', 'MM', 'X', 'M²', 'M2'])
-            
-            # Itens principais (não são categorias genéricas de uma palavra)
-            # Se tem mais de 2 palavras OU mais de 30 caracteres, é item principal
-            e_item_principal = len(palavras_desc) > 2 or len(desc) > 30
-            
-            # Incluir se:
-            # - Tem código técnico OU
-            # - Tem descrição detalhada OU
-            # - Tem especificações (dimensões) OU
-            # - É item principal (mais de 2 palavras ou mais de 30 caracteres)
-            if tem_codigo_tecnico or tem_descricao_detalhada or tem_especificacoes or e_item_principal:
-                itens.append(item)
+    fusoes = {}
+    if fundir_similares is not None:
+        with instrumentacao.etapa('fusao_similares', len(itens)) as etapa:
+            itens, contador_todos, fusoes = fundir_itens_similares(itens, contador_todos, fundir_similares)
+            etapa['saida'] = len(itens)
+            etapa['variantes_fundidas'] = sum(len(variantes) for variantes in fusoes.values())
+        exibir_fusoes(fusoes)
     
     # Agrupar itens iguais
     # Usar contador_todos para quantidade real de repetições na planilha
-    contador = Counter([item['descricao'] for item in itens])
-    
-    # Criar lista agrupada
-    itens_agrupados = []
-    valores_por_item = {}
-    unidades_por_item = {}
-    quantidades_por_item = {}
-    
-    for item in itens:
-        desc = item['descricao']
-        if desc not in valores_por_item:
-            valores_por_item[desc] = []
-            unidades_por_item[desc] = []
-            quantidades_por_item[desc] = []
-        valores_por_item[desc].append(item['valor'])
-        unidades_por_item[desc].append(item['unidade'])
-        quantidades_por_item[desc].append(item['quantidade'])
-    
-    for descricao, qtd_ocorrencias in contador.items():
-        # Usar contador_todos para quantidade real na planilha (incluindo as com valor 0)
-        qtd_real_planilha = contador_todos.get(descricao, qtd_ocorrencias)
-        valores = valores_por_item[descricao]
-        unidades = unidades_por_item[descricao]
-        quantidades = quantidades_por_item[descricao]
-        
-        # Filtrar apenas valores > 0 (remover os com valor 0/NaN que foram incluídos)
-        valores_filtrados = [v for v in valores if v > 0]
-        if not valores_filtrados:
-            continue  # Pular se não há valores > 0
-        
-        valor_total = sum(valores_filtrados)
-        valor_medio = valor_total / len(valores_filtrados) if valores_filtrados else 0
-        quantidade_total = sum(quantidades) if quantidades else qtd_ocorrencias
-        
-        # Usar unidade mais comum ou primeira disponível
-        unidade_mais_comum = max(set(unidades), key=unidades.count) if unidades else 'UN'
-        
-        itens_agrupados.append({
-            'descricao': descricao,
-            'quantidade': qtd_real_planilha,  # Número real de vezes que aparece na planilha (incluindo as com valor 0)
-            'quantidade_total': quantidade_total,  # Soma das quantidades
-            'unidade': unidade_mais_comum,
-            'valor_total': valor_total,
-            'valor_unitario': valor_medio,
-            'valores': valores_filtrados
-        })
-    
-    # Ordenar por quantidade (mais repetidos primeiro)
-    itens_agrupados.sort(key=lambda x: x['quantidade'], reverse=True)
-    
+    with instrumentacao.etapa('agrupamento', len(itens)) as etapa:
+        itens_agrupados = agrupar_itens(itens, contador_todos)
+        etapa['saida'] = len(itens_agrupados)
+    for item in itens_agrupados:
+        if item['descricao'] in fusoes:
+            item['variantes'] = fusoes[item['descricao']]
+    return itens_agrupados
+
+def processar_planilha_para_cotacao(caminho='Dartagnan.xlsx', armazem=None, fundir_similares=None,
+                                    todas_abas=False):
+    """Processa a planilha e agrupa itens repetidos.
+
+    Com `armazem` (ArmazemItensBrutos), os itens brutos de uma planilha já
+    importada são lidos do SQLite em vez do Excel. `fundir_similares` é
+    repassado a filtrar_e_agrupar. Com `todas_abas`, todas as abas são lidas
+    (em paralelo) e consolidadas; cada item agrupado ganha 'secoes', com o
+    subtotal de cada aba.
+    """
+    with instrumentacao.etapa('itens_brutos') as etapa:
+        if armazem is not None:
+            todos_itens_raw, contador_todos = armazem.obter_ou_extrair(caminho, todas_abas)
+        elif todas_abas:
+            todos_itens_raw, contador_todos = consolidar_abas(extrair_itens_abas(caminho))
+        else:
+            todos_itens_raw, contador_todos = extrair_itens_planilha(caminho)
+        etapa['saida'] = len(todos_itens_raw)
+    return filtrar_e_agrupar(todos_itens_raw, contador_todos, fundir_similares)
+
+# Incrementar sempre que as regras de extração, filtro ou agrupamento mudarem,
+# para que resultados antigos do cache deixem de ser usados.
+VERSAO_REGRAS = '3'
+
+PASTA_CACHE_PADRAO = '.cache_cotacao'
+TAMANHO_MAXIMO_CACHE = 64 * 1024 * 1024
+
+_hashes_arquivos = {}
+
+def hash_arquivo(caminho, tamanho_bloco=1024 * 1024):
+    """SHA-256 do conteúdo do arquivo (memorizado enquanto tamanho e mtime não mudam)"""
+    info = os.stat(caminho)
+    chave = (os.path.abspath(caminho), info.st_size, info.st_mtime_ns)
+    if chave not in _hashes_arquivos:
+        h = hashlib.sha256()
+        with open(caminho, 'rb') as f:
+            for bloco in iter(lambda: f.read(tamanho_bloco), b''):
+                h.update(bloco)
+        _hashes_arquivos[chave] = h.hexdigest()
+    return _hashes_arquivos[chave]
+
+class CacheResultados:
+    """Cache em disco dos itens agrupados, indexado pelo conteúdo da planilha.
+
+    Cada entrada é um JSON com o resultado de processar_planilha_para_cotacao,
+    gravado em <pasta>/<hash>.json, onde o hash combina os bytes da planilha
+    e VERSAO_REGRAS. Quando a pasta passa de `tamanho_maximo` bytes, as
+    entradas usadas há mais tempo são removidas.
+    """
+
+    def __init__(self, pasta=PASTA_CACHE_PADRAO, tamanho_maximo=TAMANHO_MAXIMO_CACHE):
+        self.pasta = pasta
+        self.tamanho_maximo = tamanho_maximo
+
+    def chave(self, caminho_planilha, variante=None):
+        """Chave da planilha; `variante` distingue resultados de opções diferentes"""
+        base = f'{VERSAO_REGRAS}:{hash_arquivo(caminho_planilha)}'
+        if variante:
+            base += f':{variante}'
+        return hashlib.sha256(base.encode()).hexdigest()
+
+    def _caminho_entrada(self, chave):
+        return os.path.join(self.pasta, f'{chave}.json')
+
+    def obter(self, chave):
+        """Retorna os itens agrupados em cache, ou None"""
+        caminho = self._caminho_entrada(chave)
+        try:
+            with open(caminho, encoding='utf-8') as f:
+                itens_agrupados = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Marcar como usado recentemente (para a remoção por tamanho)
+        try:
+            os.utime(caminho)
+        except OSError:
+            pass
+        return itens_agrupados
+
+    def salvar(self, chave, itens_agrupados):
+        os.makedirs(self.pasta, exist_ok=True)
+        caminho = self._caminho_entrada(chave)
+        temporario = f'{caminho}.{os.getpid()}.tmp'
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(itens_agrupados, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(temporario, caminho)
+        self.remover_excedente()
+
+    def remover_excedente(self):
+        """Remove as entradas menos usadas até o cache caber em tamanho_maximo"""
+        entradas = []
+        with os.scandir(self.pasta) as it:
+            for entrada in it:
+                if entrada.is_file() and entrada.name.endswith('.json'):
+                    try:
+                        info = entrada.stat()
+                    except OSError:
+                        continue  # Removida/substituída por outro processo do lote
+                    entradas.append((info.st_mtime, info.st_size, entrada.path))
+
+        total = sum(tamanho for _, tamanho, _ in entradas)
+        for _, tamanho, caminho in sorted(entradas):
+            if total <= self.tamanho_maximo:
+                break
+            try:
+                os.remove(caminho)
+            except OSError:
+                continue
+            total -= tamanho
+
+# Incrementar quando a leitura da planilha / extração dos itens brutos mudar
+VERSAO_EXTRACAO = '1'
+
+ARMAZEM_PADRAO = 'itens_brutos.sqlite'
+
+class ArmazemItensBrutos:
+    """Armazena em SQLite os itens brutos (antes dos filtros) de cada planilha importada.
+
+    As planilhas são identificadas pelo hash do conteúdo (e pela aba), então
+    mudar as regras de filtro ou agrupamento não exige ler o Excel de novo.
+    Cada planilha guarda também a assinatura do layout manual usado na
+    extração (LayoutsPlanilhas.assinatura_manual): se ela mudar, a planilha
+    é lida de novo.
+    """
+
+    def __init__(self, caminho=ARMAZEM_PADRAO):
+        import sqlite3
+
+        self.caminho = caminho
+        self.conexao = sqlite3.connect(caminho, timeout=30)
+        self.conexao.execute('PRAGMA journal_mode=WAL')
+        self.conexao.execute('PRAGMA foreign_keys=ON')
+        self.conexao.executescript("""
+            CREATE TABLE IF NOT EXISTS planilhas (
+                id INTEGER PRIMARY KEY,
+                hash TEXT NOT NULL,
+                aba TEXT NOT NULL,
+                versao_extracao TEXT NOT NULL,
+                caminho TEXT,
+                importado_em TEXT,
+                tipo_quantidade TEXT,
+                layout_manual TEXT,
+                UNIQUE (hash, aba, versao_extracao)
+            );
+            CREATE TABLE IF NOT EXISTS itens_brutos (
+                planilha_id INTEGER NOT NULL REFERENCES planilhas(id) ON DELETE CASCADE,
+                ordem INTEGER NOT NULL,
+                descricao TEXT NOT NULL,
+                valor REAL NOT NULL,
+                unidade TEXT NOT NULL,
+                quantidade REAL NOT NULL,
+                PRIMARY KEY (planilha_id, ordem)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS ocorrencias (
+                planilha_id INTEGER NOT NULL REFERENCES planilhas(id) ON DELETE CASCADE,
+                ordem INTEGER NOT NULL,
+                descricao TEXT NOT NULL,
+                quantidade INTEGER NOT NULL,
+                PRIMARY KEY (planilha_id, ordem)
+            ) WITHOUT ROWID;
+        """)
+        # Armazéns criados antes das colunas tipo_quantidade e layout_manual
+        colunas = {linha[1] for linha in self.conexao.execute('PRAGMA table_info(planilhas)')}
+        for coluna in ('tipo_quantidade', 'layout_manual'):
+            if coluna not in colunas:
+                self.conexao.execute(f'ALTER TABLE planilhas ADD COLUMN {coluna} TEXT')
+
+    def fechar(self):
+        self.conexao.close()
+
+    def _id_planilha(self, hash_planilha, aba, layout_manual=''):
+        """(id, tipo_quantidade) da planilha armazenada, ou None"""
+        return self.conexao.execute(
+            'SELECT id, tipo_quantidade FROM planilhas WHERE hash = ? AND aba = ? AND versao_extracao = ? '
+            "AND COALESCE(layout_manual, '') = ?",
+            (hash_planilha, aba, VERSAO_EXTRACAO, layout_manual)
+        ).fetchone()
+
+    def obter(self, hash_planilha, aba='', layout_manual=''):
+        """Retorna (todos_itens_raw, contador_todos) já armazenados, ou None.
+
+        Os itens de uma aba nomeada voltam marcados com 'secao' = aba. Itens
+        extraídos com outro layout manual (`layout_manual`) não servem.
+        """
+        import numpy as np
+
+        armazenada = self._id_planilha(hash_planilha, aba, layout_manual)
+        if armazenada is None:
+            return None
+        planilha_id, tipo_quantidade = armazenada
+
+        linhas = self.conexao.execute(
+            'SELECT descricao, valor, unidade, quantidade FROM itens_brutos '
+            'WHERE planilha_id = ? ORDER BY ordem', (planilha_id,)
+        ).fetchall()
+        descricoes, valores, unidades, quantidades = zip(*linhas) if linhas else ([], [], [], [])
+        # A coluna é REAL: devolver as quantidades com o tipo da extração (inteiras continuam inteiras)
+        todos_itens_raw = ItensBrutos.de_colunas(
+            descricoes, valores, np.asarray(quantidades, dtype=tipo_quantidade or 'float64'), unidades,
+            secao=aba or None
+        )
+        contador_todos = Counter(dict(self.conexao.execute(
+            'SELECT descricao, quantidade FROM ocorrencias WHERE planilha_id = ? ORDER BY ordem',
+            (planilha_id,)
+        )))
+        return todos_itens_raw, contador_todos
+
+    def salvar(self, hash_planilha, todos_itens_raw, contador_todos, aba='', caminho=None, layout_manual=''):
+        with self.conexao:
+            self.conexao.execute(
+                'DELETE FROM planilhas WHERE hash = ? AND aba = ? AND versao_extracao = ?',
+                (hash_planilha, aba, VERSAO_EXTRACAO)
+            )
+            planilha_id = self.conexao.execute(
+                'INSERT INTO planilhas (hash, aba, versao_extracao, caminho, importado_em, tipo_quantidade, '
+                'layout_manual) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (hash_planilha, aba, VERSAO_EXTRACAO, caminho, datetime.now().isoformat(timespec='seconds'),
+                 todos_itens_raw.quantidades.dtype.name, layout_manual)
+            ).lastrowid
+            # Linhas órfãs deixadas por versões que não ativavam foreign_keys (o id pode ser reaproveitado)
+            self.conexao.execute('DELETE FROM itens_brutos WHERE planilha_id = ?', (planilha_id,))
+            self.conexao.execute('DELETE FROM ocorrencias WHERE planilha_id = ?', (planilha_id,))
+            self.conexao.executemany(
+                'INSERT INTO itens_brutos VALUES (?, ?, ?, ?, ?, ?)',
+                ((planilha_id, ordem, descricao, valor, unidade, quantidade)
+                 for ordem, (descricao, valor, unidade, quantidade) in enumerate(todos_itens_raw.linhas()))
+            )
+            self.conexao.executemany(
+                'INSERT INTO ocorrencias VALUES (?, ?, ?, ?)',
+                ((planilha_id, ordem, descricao, quantidade)
+                 for ordem, (descricao, quantidade) in enumerate(contador_todos.items()))
+            )
+
+    def obter_ou_extrair(self, caminho, todas_abas=False):
+        """Itens brutos da planilha: do armazém se já importada, senão lidos do Excel e armazenados"""
+        hash_planilha = hash_arquivo(caminho)
+        layout_manual = layouts_planilhas.assinatura_manual(caminho)
+        if todas_abas:
+            return self._obter_ou_extrair_abas(caminho, hash_planilha, layout_manual)
+        armazenado = self.obter(hash_planilha, layout_manual=layout_manual)
+        if armazenado is not None:
+            print(f"♻️  Itens brutos lidos do armazém ({self.caminho}), sem reler o Excel")
+            return armazenado
+
+        todos_itens_raw, contador_todos = extrair_itens_planilha(caminho)
+        self.salvar(hash_planilha, todos_itens_raw, contador_todos, caminho=os.path.abspath(caminho),
+                    layout_manual=layout_manual)
+        return todos_itens_raw, contador_todos
+
+    def _obter_ou_extrair_abas(self, caminho, hash_planilha, layout_manual=''):
+        """Como obter_ou_extrair, aba por aba: só as abas que faltam no armazém são lidas do Excel"""
+        abas = listar_abas(caminho)
+        por_aba = {aba: self.obter(hash_planilha, aba, layout_manual) for aba in abas}
+        faltando = [aba for aba, armazenado in por_aba.items() if armazenado is None]
+        if len(faltando) < len(abas):
+            print(f"♻️  {len(abas) - len(faltando)} aba(s) lidas do armazém ({self.caminho})")
+        if faltando:
+            extraidas = extrair_itens_abas(caminho, faltando)
+            for aba, (todos_itens_raw, contador_todos) in extraidas.items():
+                self.salvar(hash_planilha, todos_itens_raw, contador_todos, aba=aba,
+                            caminho=os.path.abspath(caminho), layout_manual=layout_manual)
+            por_aba.update(extraidas)
+        return consolidar_abas(por_aba)
+
+def processar_planilha_com_cache(caminho, cache=None, armazem=None, fundir_similares=None, todas_abas=False):
+    """Como processar_planilha_para_cotacao, mas reaproveita o resultado se a planilha não mudou"""
+    if cache is None:
+        return processar_planilha_para_cotacao(caminho, armazem, fundir_similares, todas_abas)
+
+    variante = []
+    if fundir_similares is not None:
+        variante.append(f'similares={fundir_similares}')
+    if todas_abas:
+        variante.append('abas=todas')
+    # Corrigir o layout no arquivo manual invalida o resultado extraído com o anterior
+    layout_manual = layouts_planilhas.assinatura_manual(caminho)
+    if layout_manual:
+        variante.append(f'layout={layout_manual}')
+    chave = cache.chave(caminho, ','.join(variante))
+    with instrumentacao.etapa('cache_resultados') as etapa:
+        itens_agrupados = cache.obter(chave)
+        etapa['saida'] = None if itens_agrupados is None else len(itens_agrupados)
+    if itens_agrupados is not None:
+        print(f"♻️  Planilha sem alterações, usando resultado do cache ({cache.pasta})")
+        return itens_agrupados
+
+    itens_agrupados = processar_planilha_para_cotacao(caminho, armazem, fundir_similares, todas_abas)
+    cache.salvar(chave, itens_agrupados)
     return itens_agrupados
 
-def buscar_imagem_item(numero_item):
-    """Busca imagem para um item baseado no número sequencial (1 a 39)"""
-    # Procurar pasta de imagens
-    pastas_imagens = ['imagens', 'fotos', 'images', 'photos', '.']
-    extensoes = ['jpg', 'jpeg', 'png', 'gif', 'webp']
-    
-    # Garantir que numero_item é inteiro
-    numero_item = int(numero_item)
-    
-    # Buscar arquivo com o número do item
-    for pasta in pastas_imagens:
-        if not os.path.exists(pasta):
-            continue
-        
-        # Buscar arquivos com o número do item
-        for ext in extensoes:
-            # Tentar diferentes formatos: 1.jpg, 01.jpg, item1.jpg, etc.
-            possiveis_nomes = [
-                f'{numero_item}.{ext}',
-                f'{numero_item:02d}.{ext}',  # 01.jpg, 02.jpg, etc.
-                f'item{numero_item}.{ext}',
-                f'item{numero_item:02d}.{ext}',
-                f'#{numero_item}.{ext}',
-                f'#{numero_item:02d}.{ext}'
-            ]
-            
-            for nome in possiveis_nomes:
-                caminho = os.path.join(pasta, nome)
-                if os.path.exists(caminho):
-                    return caminho.replace('\\', '/')
-    
-    return None
+HISTORICO_PADRAO = 'historico_precos.sqlite'
+
+def normalizar_descricao(descricao):
+    """Descrição sem acentos, em minúsculas e com espaços simples (chave do histórico)"""
+    return ' '.join(normalizar_texto(descricao).split())
+
+class HistoricoPrecos:
+    """Histórico, em SQLite, dos itens agrupados de cada medição processada.
+
+    Cada execução (identificada pelo hash da planilha) grava o preço de todos
+    os itens. Reprocessar a mesma planilha substitui o registro anterior.
+    """
+
+    def __init__(self, caminho=HISTORICO_PADRAO):
+        import sqlite3
+
+        self.caminho = caminho
+        self.conexao = sqlite3.connect(caminho, timeout=30)
+        self.conexao.execute('PRAGMA foreign_keys=ON')
+        self.conexao.executescript("""
+            CREATE TABLE IF NOT EXISTS execucoes (
+                id INTEGER PRIMARY KEY,
+                data TEXT NOT NULL,
+                planilha TEXT,
+                hash TEXT UNIQUE
+            );
+            CREATE TABLE IF NOT EXISTS precos (
+                execucao_id INTEGER NOT NULL REFERENCES execucoes(id) ON DELETE CASCADE,
+                data TEXT NOT NULL,
+                descricao TEXT NOT NULL,
+                descricao_normalizada TEXT NOT NULL,
+                unidade TEXT,
+                quantidade INTEGER,
+                quantidade_total REAL,
+                valor_unitario REAL NOT NULL,
+                valor_total REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_precos_descricao_data ON precos (descricao_normalizada, data);
+            CREATE INDEX IF NOT EXISTS idx_precos_data ON precos (data);
+        """)
+
+    def fechar(self):
+        self.conexao.close()
+
+    @staticmethod
+    def _data_iso(data):
+        """Data da medição como 'AAAA-MM-DD' (a ordenação compara as strings); padrão: hoje"""
+        if data is None:
+            return date.today().isoformat()
+        if isinstance(data, datetime):
+            data = data.date()
+        if not isinstance(data, date):
+            data = date.fromisoformat(data)  # ValueError para datas fora do formato ISO
+        return data.isoformat()
+
+    def registrar(self, itens_agrupados, planilha=None, data=None):
+        """Grava os itens de uma execução; retorna o id da execução"""
+        data = self._data_iso(data)
+        hash_planilha = hash_arquivo(planilha) if planilha and os.path.exists(planilha) else None
+        with self.conexao:
+            if hash_planilha:
+                self.conexao.execute('DELETE FROM execucoes WHERE hash = ?', (hash_planilha,))
+            execucao_id = self.conexao.execute(
+                'INSERT INTO execucoes (data, planilha, hash) VALUES (?, ?, ?)',
+                (data, os.path.basename(planilha) if planilha else None, hash_planilha)
+            ).lastrowid
+            self.conexao.executemany(
+                'INSERT INTO precos VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                ((execucao_id, data, item['descricao'], normalizar_descricao(item['descricao']),
+                  item.get('unidade'), item.get('quantidade'), item.get('quantidade_total'),
+                  item['valor_unitario'], item['valor_total'])
+                 for item in itens_agrupados)
+            )
+        return execucao_id
+
+    def precos_anteriores(self, itens_agrupados, data=None, excluir_execucao=None):
+        """Último preço registrado antes de `data` para cada item: {descricao: {...}}.
+
+        Medições da mesma data não contam como anteriores.
+        """
+        data = self._data_iso(data)
+        comparacao = {}
+        consulta = (
+            'SELECT p.valor_unitario, p.data, e.planilha FROM precos p '
+            'JOIN execucoes e ON e.id = p.execucao_id '
+            'WHERE p.descricao_normalizada = ? AND p.data < ? AND p.execucao_id IS NOT ? '
+            'ORDER BY p.data DESC, p.execucao_id DESC LIMIT 1'
+        )
+        for item in itens_agrupados:
+            linha = self.conexao.execute(
+                consulta, (normalizar_descricao(item['descricao']), data, excluir_execucao)
+            ).fetchone()
+            if linha:
+                comparacao[item['descricao']] = {
+                    'valor_unitario': linha[0], 'data': linha[1], 'planilha': linha[2]
+                }
+        return comparacao
+
+    def historico(self, descricao):
+        """Todos os preços registrados de uma descrição, do mais antigo ao mais recente"""
+        return [
+            {'data': data, 'planilha': planilha, 'unidade': unidade,
+             'valor_unitario': valor_unitario, 'valor_total': valor_total}
+            for data, planilha, unidade, valor_unitario, valor_total in self.conexao.execute(
+                'SELECT p.data, e.planilha, p.unidade, p.valor_unitario, p.valor_total FROM precos p '
+                'JOIN execucoes e ON e.id = p.execucao_id '
+                'WHERE p.descricao_normalizada = ? ORDER BY p.data, p.execucao_id',
+                (normalizar_descricao(descricao),)
+            )
+        ]
+
+PASTAS_IMAGENS = ['imagens', 'fotos', 'images', 'photos', '.']
+EXTENSOES_IMAGENS = ['jpg', 'jpeg', 'png', 'gif', 'webp']
+
+# Nomes aceitos: 1.jpg, 01.jpg, item1.jpg, item01.jpg, #1.jpg, #01.jpg
+_RE_NOME_IMAGEM = re.compile(r'^(item|#)?(\d+)\.([^.]+)$')
+_PREFIXOS_IMAGEM = ['', 'item', '#']
+
+class IndiceImagens:
+    """Índice {numero_item: caminho} montado com uma única leitura de cada pasta.
+
+    A prioridade é a mesma da busca arquivo a arquivo: pasta, depois extensão,
+    depois formato do nome. O índice é refeito quando o mtime de alguma pasta
+    muda (arquivo adicionado, removido ou renomeado).
+    """
+
+    def __init__(self, pastas=PASTAS_IMAGENS, extensoes=EXTENSOES_IMAGENS):
+        self.pastas = list(pastas)
+        self.extensoes = [os.path.normcase(ext) for ext in extensoes]
+        self._assinatura = None
+        self._indice = {}
+
+    def _assinatura_pastas(self):
+        assinatura = []
+        for pasta in self.pastas:
+            try:
+                mtime = os.stat(pasta).st_mtime_ns
+            except OSError:
+                mtime = None
+            assinatura.append((os.path.abspath(pasta), mtime))
+        return tuple(assinatura)
+
+    def _montar(self):
+        indice = {}
+        prioridades = {}
+        for prioridade_pasta, pasta in enumerate(self.pastas):
+            try:
+                nomes = os.listdir(pasta)
+            except OSError:
+                continue
+
+            for nome in nomes:
+                encontrado = _RE_NOME_IMAGEM.match(os.path.normcase(nome))
+                if not encontrado:
+                    continue
+                prefixo, digitos, ext = encontrado.groups()
+                if ext not in self.extensoes:
+                    continue
+
+                numero_item = int(digitos)
+                if digitos == str(numero_item):
+                    formato = 0
+                elif digitos == f'{numero_item:02d}':
+                    formato = 1
+                else:
+                    continue
+
+                prioridade = (
+                    prioridade_pasta,
+                    self.extensoes.index(ext),
+                    _PREFIXOS_IMAGEM.index(prefixo or '') * 2 + formato
+                )
+                if numero_item not in prioridades or prioridade < prioridades[numero_item]:
+                    prioridades[numero_item] = prioridade
+                    indice[numero_item] = os.path.join(pasta, nome).replace('\\', '/')
+        return indice
+
+    def obter(self):
+        """Retorna o índice, refazendo a leitura das pastas só se alguma mudou"""
+        assinatura = self._assinatura_pastas()
+        if assinatura != self._assinatura:
+            self._indice = self._montar()
+            self._assinatura = assinatura
+        return self._indice
+
+indice_imagens = IndiceImagens()
+
+def buscar_imagem_item(numero_item):
+    """Busca imagem para um item baseado no número sequencial (1 a 39)"""
+    # Garantir que numero_item é inteiro
+    return indice_imagens.obter().get(int(numero_item))
+
+PASTA_MINIATURAS_PADRAO = 'miniaturas'
+TAMANHO_MINIATURA = (400, 400)
+
+def _gerar_miniatura(origem, pasta, tamanho):
+    """Gera (ou reaproveita) a miniatura de uma imagem; retorna o caminho ou None.
+
+    WebP quando o Pillow foi compilado com suporte a ele; JPEG caso contrário.
+    O nome mantém a extensão da original (imagens/1.jpg -> imagens_1.jpg.webp)
+    e a miniatura recebe o mtime dela: é reaproveitada só enquanto os mtimes
+    forem iguais, mesmo que a foto seja trocada por um arquivo mais antigo.
+    """
+    from PIL import Image, features
+
+    webp = features.check('webp')
+    nome = re.sub(r'[^\w.-]+', '_', os.path.normpath(origem)).strip('_')
+    destino = os.path.join(pasta, nome + ('.webp' if webp else '.jpg'))
+
+    try:
+        mtime_origem = os.stat(origem).st_mtime_ns
+    except OSError as e:
+        print(f"⚠️  Não foi possível gerar miniatura de {origem}: {e}")
+        return None
+
+    # Reaproveitar enquanto a imagem original não for alterada
+    try:
+        if os.stat(destino).st_mtime_ns == mtime_origem:
+            return destino.replace('\\', '/')
+    except OSError:
+        pass
+
+    temporario = f'{destino}.{os.getpid()}.tmp'
+    try:
+        with Image.open(origem) as img:
+            img.thumbnail(tamanho)
+            if webp:
+                if img.mode not in ('RGB', 'RGBA'):
+                    img = img.convert('RGBA' if 'transparency' in img.info or img.mode in ('LA', 'PA') else 'RGB')
+                img.save(temporario, format='WEBP', quality=80)
+            else:
+                img.convert('RGB').save(temporario, format='JPEG', quality=80)
+        os.utime(temporario, ns=(mtime_origem, mtime_origem))
+        os.replace(temporario, destino)
+    except (OSError, ValueError, KeyError) as e:
+        # KeyError: formato de gravação ausente nesta instalação do Pillow
+        print(f"⚠️  Não foi possível gerar miniatura de {origem}: {e}")
+        return None
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+    return destino.replace('\\', '/')
+
+def gerar_miniaturas(imagens, pasta=PASTA_MINIATURAS_PADRAO, tamanho=TAMANHO_MINIATURA, processos=None):
+    """Gera as miniaturas das imagens em paralelo; retorna {imagem_original: miniatura}.
+
+    Requer Pillow. Sem ele, retorna {} e a página usa as fotos originais.
+    """
+    imagens = sorted(set(i for i in imagens if i))
+    if not imagens:
+        return {}
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        print("⚠️  Pillow não instalado (pip install pillow): usando as imagens originais")
+        return {}
+
+    os.makedirs(pasta, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=processos) as executor:
+        miniaturas = executor.map(lambda origem: _gerar_miniatura(origem, pasta, tamanho), imagens)
+        return {origem: miniatura for origem, miniatura in zip(imagens, miniaturas) if miniatura}
+
+ARQUIVOS_CHECKLIST = ['checklist.xlsx', 'Checklist.xlsx', 'CHECKLIST.xlsx',
+                      'checklist.xls', 'checklist.ods', 'checklist.csv']
 
 def processar_checklist():
     """Processa arquivo Excel de checklist"""
-    arquivos_checklist = ['checklist.xlsx', 'Checklist.xlsx', 'CHECKLIST.xlsx']
+    import pandas as pd
+
     arquivo_encontrado = None
     
-    for arquivo in arquivos_checklist:
+    for arquivo in ARQUIVOS_CHECKLIST:
         if os.path.exists(arquivo):
             arquivo_encontrado = arquivo
             break
@@ -284,7 +1715,8 @@ def processar_checklist():
         return None
     
     try:
-        df = pd.read_excel(arquivo_encontrado, header=None)
+        linhas = ler_linhas_planilha(arquivo_encontrado)
+        df = _montar_dataframe(linhas, None) if linhas else pd.DataFrame()
         checklist_data = []
         
         # Processar dados do checklist
@@ -322,10 +1754,10 @@ def processar_checklist():
         print(f"Erro ao processar checklist: {e}")
         return None
 
-def criar_html_checklist(checklist_data):
-    """Cria HTML para o checklist"""
+def gerar_html_checklist(checklist_data):
+    """Gera o HTML do checklist em partes"""
     if not checklist_data:
-        return """
+        yield """
         <div style="text-align: center; padding: 40px;">
             <p style="color: #666; margin-bottom: 20px;">
                 📋 Nenhum arquivo de checklist encontrado.
@@ -335,12 +1767,13 @@ def criar_html_checklist(checklist_data):
             </p>
         </div>
         """
+        return
     
     total = len(checklist_data)
     concluidos = sum(1 for item in checklist_data if item.get('concluido', False))
     pendentes = total - concluidos
     
-    html_content = f"""
+    yield f"""
     <div style="max-width: 800px; margin: 0 auto;">
         <div style="background: #f8f9fa; padding: 20px; border-radius: 10px; margin-bottom: 20px;">
             <p style="margin: 0; color: #666;">
@@ -367,7 +1800,7 @@ def criar_html_checklist(checklist_data):
         checked = 'checked' if concluido else ''
         linha_style = 'background: #e8f5e9;' if concluido else ''
         
-        html_content += f"""
+        yield f"""
                     <tr style="{linha_style}">
                         <td style="padding: 12px 15px; text-align: center;">
                             <input type="checkbox" id="check_{i-1}" {checked} onchange="atualizarChecklist({i-1}, this.checked)" 
@@ -383,7 +1816,7 @@ def criar_html_checklist(checklist_data):
     
     checklist_json = json.dumps(checklist_data, ensure_ascii=False)
     
-    html_content += f"""
+    yield f"""
                 </tbody>
             </table>
         </div>
@@ -444,25 +1877,485 @@ def criar_html_checklist(checklist_data):
         }});
     </script>
 """
+
+def criar_html_checklist(checklist_data):
+    """Cria HTML para o checklist"""
+    return ''.join(gerar_html_checklist(checklist_data))
+
+def preparar_item_html(item, numero=None, pasta_html=None):
+    """Prepara os campos de um item já escapados/formatados para a tabela e os cards.
+
+    `pasta_html` é a pasta onde a página será gravada: os caminhos das imagens
+    (relativos à pasta atual) passam a ser relativos a ela.
+    """
+    desc_escaped = html.escape(item['descricao'])
+    # Miniatura (quando gerada) no lugar da foto original
+    imagem = item.get('miniatura') or item.get('imagem', None)
+    if imagem and pasta_html:
+        imagem = os.path.relpath(imagem, pasta_html).replace('\\', '/')
+    return {
+        'numero_item': item.get('numero_item', numero),
+        'descricao': desc_escaped,
+        'descricao_curta': desc_escaped[:50],
+        'unidade': html.escape(str(item.get('unidade', 'UN'))),
+        'quantidade': item.get('quantidade_total', item['quantidade']),
+        'valor_unitario': formatar_reais(item['valor_unitario']),
+        'valor_total': formatar_reais(item['valor_total']),
+        'imagem': html.escape(imagem) if imagem else None
+    }
+
+def _html_tooltip(item_html):
+    numero_item = item_html['numero_item']
+    return f"""
+                            <span class="icon-imagem">📷</span>
+                            <div class="tooltip">
+                                <img loading="lazy" src="{item_html['imagem']}" alt="Imagem do item #{numero_item}" onerror="this.style.display='none'; this.parentElement.querySelector('.tooltip-text').textContent='Imagem #{numero_item} não encontrada';">
+                                <div class="tooltip-text">Item #{numero_item}: {item_html['descricao_curta']}...</div>
+                            </div>"""
+
+def renderizar_linha_tabela(item_html):
+    """Linha <tr> da tabela (desktop) de um item"""
+    # Se tiver imagem, adicionar tooltip
+    if item_html['imagem']:
+        celula_descricao = f"""<td class="descricao item-com-imagem">
+                            {item_html['descricao']}{_html_tooltip(item_html)}
+                        </td>"""
+    else:
+        celula_descricao = f"""<td class="descricao">{item_html['descricao']}</td>"""
+    
+    return f"""
+                    <tr>
+                        <td><strong>#{item_html['numero_item']}</strong></td>
+                        {celula_descricao}
+                        <td class="number">
+                            <span class="quantidade-badge">{item_html['quantidade']}</span>
+                        </td>
+                        <td class="number">{item_html['unidade']}</td>
+                        <td class="number">{item_html['valor_unitario']}</td>
+                        <td class="number"><strong>{item_html['valor_total']}</strong></td>
+                    </tr>
+"""
+
+def renderizar_card_mobile(item_html):
+    """Card (mobile) de um item"""
+    # Se tiver imagem, adicionar tooltip
+    if item_html['imagem']:
+        classe_descricao = 'mobile-card-desc item-com-imagem'
+        tooltip = _html_tooltip(item_html)
+    else:
+        classe_descricao = 'mobile-card-desc'
+        tooltip = ''
     
-    return html_content
+    return f"""
+                    <div class="mobile-card">
+                        <div class="mobile-card-header">
+                            <span class="mobile-card-title">#{item_html['numero_item']}</span>
+                            <span class="quantidade-badge">{item_html['quantidade']} {item_html['unidade']}</span>
+                        </div>
+                        <div class="mobile-card-content">
+                            <span class="mobile-card-label">Valor Unitário:</span>
+                            <span class="mobile-card-value">{item_html['valor_unitario']}</span>
+                            <span class="mobile-card-label">Valor Total:</span>
+                            <span class="mobile-card-value"><strong>{item_html['valor_total']}</strong></span>
+                        </div>
+                        <div class="{classe_descricao}">
+                            {item_html['descricao']}{tooltip}
+                        </div>
+                    </div>
+"""
 
-def criar_html_cotacao(itens_agrupados):
-    """Cria página HTML focada em cotação"""
+ITENS_POR_PAGINA = 50
+
+HTML_CONTROLES_PAGINACAO = """                
+                <!-- Paginação -->
+                <div class="paginacao" style="display: flex; justify-content: center; align-items: center; gap: 15px; margin-top: 20px;">
+                    <button type="button" class="tab-button" id="pagina-anterior">‹ Anterior</button>
+                    <span id="pagina-info" style="color: #666;"></span>
+                    <button type="button" class="tab-button" id="pagina-proxima">Próxima ›</button>
+                </div>
+"""
+
+SCRIPT_PAGINADO = """
+        // Renderiza apenas a página visível da tabela e dos cards
+        (function() {
+            const tbody = document.querySelector('#insumos tbody');
+            const containerCards = document.querySelector('#insumos .mobile-cards-container');
+            const info = document.getElementById('pagina-info');
+            const botaoAnterior = document.getElementById('pagina-anterior');
+            const botaoProxima = document.getElementById('pagina-proxima');
+            let filtrados = ITENS;
+            let totalPaginas = 1;
+            let paginaAtual = 0;
+            
+            // Campos: número, descrição, quantidade, unidade, valor unitário, valor total, imagem (já escapados)
+            function tooltip(item) {
+                const n = item[0];
+                const curta = Array.from(item[1]).slice(0, 50).join('');
+                return '<span class="icon-imagem">📷</span>' +
+                    '<div class="tooltip">' +
+                    '<img loading="lazy" src="' + item[6] + '" alt="Imagem do item #' + n + '" onerror="this.style.display=\\'none\\'; this.parentElement.querySelector(\\'.tooltip-text\\').textContent=\\'Imagem #' + n + ' não encontrada\\';">' +
+                    '<div class="tooltip-text">Item #' + n + ': ' + curta + '...</div>' +
+                    '</div>';
+            }
+            
+            function linhaTabela(item) {
+                const descricao = item[6]
+                    ? '<td class="descricao item-com-imagem">' + item[1] + tooltip(item) + '</td>'
+                    : '<td class="descricao">' + item[1] + '</td>';
+                return '<tr><td><strong>#' + item[0] + '</strong></td>' + descricao +
+                    '<td class="number"><span class="quantidade-badge">' + item[2] + '</span></td>' +
+                    '<td class="number">' + item[3] + '</td>' +
+                    '<td class="number">' + item[4] + '</td>' +
+                    '<td class="number"><strong>' + item[5] + '</strong></td></tr>';
+            }
+            
+            function cardMobile(item) {
+                return '<div class="mobile-card">' +
+                    '<div class="mobile-card-header">' +
+                    '<span class="mobile-card-title">#' + item[0] + '</span>' +
+                    '<span class="quantidade-badge">' + item[2] + ' ' + item[3] + '</span>' +
+                    '</div>' +
+                    '<div class="mobile-card-content">' +
+                    '<span class="mobile-card-label">Valor Unitário:</span>' +
+                    '<span class="mobile-card-value">' + item[4] + '</span>' +
+                    '<span class="mobile-card-label">Valor Total:</span>' +
+                    '<span class="mobile-card-value"><strong>' + item[5] + '</strong></span>' +
+                    '</div>' +
+                    '<div class="mobile-card-desc' + (item[6] ? ' item-com-imagem' : '') + '">' +
+                    item[1] + (item[6] ? tooltip(item) : '') +
+                    '</div></div>';
+            }
+            
+            function mostrarPagina(pagina) {
+                totalPaginas = Math.max(1, Math.ceil(filtrados.length / ITENS_POR_PAGINA));
+                paginaAtual = Math.min(Math.max(pagina, 0), totalPaginas - 1);
+                const itens = filtrados.slice(paginaAtual * ITENS_POR_PAGINA, (paginaAtual + 1) * ITENS_POR_PAGINA);
+                // Um único innerHTML por container (sem montar nós item a item)
+                tbody.innerHTML = itens.map(linhaTabela).join('');
+                containerCards.innerHTML = itens.map(cardMobile).join('');
+                info.textContent = 'Página ' + (paginaAtual + 1) + ' de ' + totalPaginas + ' (' + filtrados.length + ' itens)';
+                botaoAnterior.disabled = paginaAtual === 0;
+                botaoProxima.disabled = paginaAtual === totalPaginas - 1;
+            }
+            
+            botaoAnterior.addEventListener('click', function() { mostrarPagina(paginaAtual - 1); });
+            botaoProxima.addEventListener('click', function() { mostrarPagina(paginaAtual + 1); });
+            
+            // Chamado pela busca: mascara[i] indica se ITENS[i] passa no filtro
+            window.aplicarFiltroPaginado = function(mascara) {
+                filtrados = ITENS.filter(function(_, i) { return mascara[i]; });
+                mostrarPagina(0);
+            };
+            
+            mostrarPagina(0);
+        })();
+        
+        // Tooltips: um único listener delegado para todos os itens (inclusive os de outras páginas)
+        (function() {
+            let activeTooltip = null;
+            
+            function fecharTooltip() {
+                if (activeTooltip) {
+                    activeTooltip.classList.remove('active');
+                    activeTooltip = null;
+                }
+            }
+            
+            // Desktop: hover (mouseover propaga, mouseenter não)
+            document.addEventListener('mouseover', function(e) {
+                if (window.innerWidth <= 768) return;
+                const item = e.target.closest('.item-com-imagem');
+                if (!item || item.contains(e.relatedTarget)) return;
+                const tooltip = item.querySelector('.tooltip');
+                if (!tooltip) return;
+                
+                // Ajustar posicionamento baseado na posição na tela
+                const rect = item.getBoundingClientRect();
+                const tooltipRect = tooltip.getBoundingClientRect();
+                
+                // Se tooltip sair da tela à direita, alinhar à direita
+                if (rect.left + tooltipRect.width > window.innerWidth) {
+                    tooltip.style.left = 'auto';
+                    tooltip.style.right = '0';
+                    tooltip.style.transform = 'none';
+                } else {
+                    tooltip.style.left = '50%';
+                    tooltip.style.right = 'auto';
+                    tooltip.style.transform = 'translateX(-50%)';
+                }
+                
+                // Se tooltip sair da tela acima, mostrar abaixo
+                if (rect.top - tooltipRect.height < 0) {
+                    tooltip.style.bottom = 'auto';
+                    tooltip.style.top = '100%';
+                    tooltip.style.marginBottom = '0';
+                    tooltip.style.marginTop = '10px';
+                } else {
+                    tooltip.style.bottom = '100%';
+                    tooltip.style.top = 'auto';
+                    tooltip.style.marginBottom = '10px';
+                    tooltip.style.marginTop = '0';
+                }
+            });
+            
+            // Mobile: touch abre o tooltip do item; tocar fora fecha
+            document.addEventListener('touchstart', function(e) {
+                if (window.innerWidth > 768) return;
+                const item = e.target.closest('.item-com-imagem');
+                if (item && item.querySelector('.tooltip')) {
+                    e.preventDefault();
+                    fecharTooltip();
+                    item.classList.add('active');
+                    activeTooltip = item;
+                } else if (activeTooltip && !activeTooltip.contains(e.target)) {
+                    fecharTooltip();
+                }
+            }, { passive: false });
+            
+            // Fechar tooltip ao clicar fora (mobile)
+            document.addEventListener('click', function(e) {
+                if (window.innerWidth <= 768 && activeTooltip && !activeTooltip.contains(e.target)) {
+                    fecharTooltip();
+                }
+            });
+        })();
+    </script>
+</body>
+</html>
+"""
+
+def _json_para_script(dados):
+    """Serializa dados para embutir com segurança dentro de uma tag <script>"""
+    return json.dumps(dados, ensure_ascii=False, separators=(',', ':')).replace('</', '<\\/')
+
+def gerar_script_paginado(itens_html, itens_por_pagina=ITENS_POR_PAGINA):
+    """Dados compactos (JSON) e script da tabela paginada"""
+    dados = [
+        [item['numero_item'], item['descricao'], str(item['quantidade']), item['unidade'],
+         item['valor_unitario'], item['valor_total'], item['imagem']]
+        for item in itens_html
+    ]
+    yield f"""        const ITENS_POR_PAGINA = {int(itens_por_pagina)};
+        const ITENS = {_json_para_script(dados)};
+"""
+    yield SCRIPT_PAGINADO
+
+HTML_BUSCA = """                
+                <!-- Busca e filtros -->
+                <div class="busca" style="display: flex; flex-wrap: wrap; gap: 10px; align-items: center; margin-bottom: 10px;">
+                    <input type="search" id="busca-texto" placeholder="🔍 Buscar item (ex.: tubo pvc 25mm)" autocomplete="off"
+                           style="flex: 1 1 260px; padding: 10px 14px; border: 2px solid #e0e0e0; border-radius: 8px; font-size: 1em;">
+                    <select id="busca-unidade" style="padding: 10px; border: 2px solid #e0e0e0; border-radius: 8px; font-size: 1em;">
+                        <option value="">Todas as unidades</option>
+                    </select>
+                    <input type="number" id="busca-preco-min" placeholder="R$ mín." min="0" step="0.01"
+                           style="width: 110px; padding: 10px; border: 2px solid #e0e0e0; border-radius: 8px; font-size: 1em;">
+                    <input type="number" id="busca-preco-max" placeholder="R$ máx." min="0" step="0.01"
+                           style="width: 110px; padding: 10px; border: 2px solid #e0e0e0; border-radius: 8px; font-size: 1em;">
+                    <span id="busca-contador" style="color: #666; font-size: 0.9em;"></span>
+                </div>
+"""
+
+SCRIPT_BUSCA = """
+        // Busca: consulta o índice em memória e mostra/esconde linhas e cards numa única passada
+        (function() {
+            const campoTexto = document.getElementById('busca-texto');
+            const campoUnidade = document.getElementById('busca-unidade');
+            const campoMin = document.getElementById('busca-preco-min');
+            const campoMax = document.getElementById('busca-preco-max');
+            const contador = document.getElementById('busca-contador');
+            
+            // Mesma normalização do índice: sem acentos, minúsculas, só letras e números
+            function tokens(texto) {
+                return texto.normalize('NFKD').replace(/[\\u0300-\\u036f]/g, '').toLowerCase().match(/[\\p{L}\\p{N}]+/gu) || [];
+            }
+            
+            Array.from(new Set(INDICE_BUSCA.map(function(entrada) { return entrada[1]; }))).sort().forEach(function(unidade) {
+                const opcao = document.createElement('option');
+                opcao.value = unidade;
+                opcao.textContent = unidade;
+                campoUnidade.appendChild(opcao);
+            });
+            
+            function filtrar() {
+                const termos = tokens(campoTexto.value).map(function(t) { return ' ' + t; });
+                const unidade = campoUnidade.value;
+                const minimo = parseFloat(campoMin.value);
+                const maximo = parseFloat(campoMax.value);
+                let visiveis = 0;
+                
+                const mascara = INDICE_BUSCA.map(function(entrada) {
+                    const ok = termos.every(function(t) { return entrada[0].indexOf(t) !== -1; })
+                        && (!unidade || entrada[1] === unidade)
+                        && (isNaN(minimo) || entrada[2] >= minimo)
+                        && (isNaN(maximo) || entrada[2] <= maximo);
+                    if (ok) visiveis++;
+                    return ok;
+                });
+                
+                if (window.aplicarFiltroPaginado) {
+                    window.aplicarFiltroPaginado(mascara);
+                } else {
+                    const linhas = document.querySelectorAll('#insumos tbody tr');
+                    const cards = document.querySelectorAll('#insumos .mobile-card');
+                    for (let i = 0; i < mascara.length; i++) {
+                        const display = mascara[i] ? '' : 'none';
+                        if (linhas[i]) linhas[i].style.display = display;
+                        if (cards[i]) cards[i].style.display = display;
+                    }
+                }
+                
+                contador.textContent = visiveis === INDICE_BUSCA.length ? '' : visiveis + ' de ' + INDICE_BUSCA.length + ' itens';
+            }
+            
+            // Filtrar no máximo uma vez por quadro enquanto o usuário digita
+            let agendado = false;
+            function agendarFiltro() {
+                if (agendado) return;
+                agendado = true;
+                requestAnimationFrame(function() {
+                    agendado = false;
+                    filtrar();
+                });
+            }
+            
+            [campoTexto, campoMin, campoMax].forEach(function(campo) { campo.addEventListener('input', agendarFiltro); });
+            campoUnidade.addEventListener('change', agendarFiltro);
+        })();
+"""
+
+def normalizar_texto(texto):
+    """Minúsculas e sem acentos (ex.: 'Água Bruta' -> 'agua bruta')"""
+    decomposto = unicodedata.normalize('NFKD', str(texto))
+    return ''.join(c for c in decomposto if not unicodedata.combining(c)).lower()
+
+def tokens_busca(texto):
+    """Palavras normalizadas (apenas letras e números) usadas pela busca"""
+    return re.findall(r'[^\W_]+', normalizar_texto(texto))
+
+def gerar_script_busca(itens):
+    """Índice de busca pré-calculado (tokens, unidade, valor unitário) e script do filtro"""
+    indice = []
+    for item in itens:
+        tokens = dict.fromkeys(tokens_busca(item['descricao']))
+        indice.append([
+            ' ' + ' '.join(tokens),
+            str(item.get('unidade', 'UN')),
+            float(arredondar_reais(item['valor_unitario']))
+        ])
+    yield f"""
+                <script>
+        const INDICE_BUSCA = {_json_para_script(indice)};
+"""
+    yield SCRIPT_BUSCA
+    yield """                </script>
+"""
+
+def gerar_html_historico(itens, comparacao_precos):
+    """Aba com o preço unitário anterior de cada item e a variação em relação ao atual"""
+    com_anterior = sum(1 for item in itens if item['descricao'] in comparacao_precos)
+    yield f"""            
+            <div id="historico" class="tab-content">
+                <h2 class="section-title">📈 Histórico de Preços</h2>
+                <p style="color: #666; margin-bottom: 10px;">
+                    {com_anterior} de {len(itens)} itens com preço em medições anteriores.
+                </p>
+                <div class="table-wrapper">
+                    <table>
+                    <thead>
+                        <tr>
+                            <th>#</th>
+                            <th>Descrição do Item</th>
+                            <th class="number">Unidade</th>
+                            <th class="number">Valor Anterior (R$)</th>
+                            <th class="number">Valor Atual (R$)</th>
+                            <th class="number">Variação</th>
+                        </tr>
+                    </thead>
+                    <tbody>
+"""
+    for i, item in enumerate(itens, 1):
+        anterior = comparacao_precos.get(item['descricao'])
+        if anterior:
+            valor_anterior = anterior['valor_unitario']
+            data_anterior = html.escape(str(anterior['data']))
+            celula_anterior = f"{formatar_reais(valor_anterior)}<br><small style=\"color: #999;\">{data_anterior}</small>"
+            if valor_anterior:
+                variacao = (item['valor_unitario'] - valor_anterior) / valor_anterior * 100
+                cor = '#d32f2f' if variacao > 0 else '#2e7d32' if variacao < 0 else '#666'
+                celula_variacao = f'<strong style="color: {cor};">{variacao:+.1f}%</strong>'
+            else:
+                celula_variacao = '-'
+        else:
+            celula_anterior = '<span style="color: #999;">sem histórico</span>'
+            celula_variacao = '-'
+
+        yield f"""
+                    <tr>
+                        <td><strong>#{item.get('numero_item', i)}</strong></td>
+                        <td class="descricao">{html.escape(item['descricao'])}</td>
+                        <td class="number">{html.escape(str(item.get('unidade', 'UN')))}</td>
+                        <td class="number">{celula_anterior}</td>
+                        <td class="number">{formatar_reais(item['valor_unitario'])}</td>
+                        <td class="number">{celula_variacao}</td>
+                    </tr>
+"""
+    yield """
+                    </tbody>
+                </table>
+                </div>
+            </div>
+"""
+
+def gerar_html_cotacao(itens_agrupados, paginado=False,
+                       itens_por_pagina=ITENS_POR_PAGINA, pasta_miniaturas=None,
+                       comparacao_precos=None, pasta_html=None):
+    """Gera a página HTML de cotação em partes, na ordem do documento.
+
+    Com `paginado`, os itens vão para a página como JSON e só a página
+    visível é montada no navegador.
+    Com `pasta_miniaturas`, os tooltips usam miniaturas geradas nessa pasta.
+    Com `comparacao_precos` ({descricao: preço anterior}, ver HistoricoPrecos),
+    a página ganha a aba de histórico com a variação de cada item.
+    Com `pasta_html`, os links das imagens são relativos a essa pasta (a da
+    página gravada) em vez da pasta atual.
+    """
     
     # Incluir TODOS os itens (repetidos e únicos)
     itens_repetidos = itens_agrupados
     
-    # Buscar imagens para cada item pelo número sequencial
-    for i, item in enumerate(itens_repetidos, 1):
-        item['imagem'] = buscar_imagem_item(i)
-        item['numero_item'] = i  # Adicionar número do item
+    # Buscar imagens para cada item pelo número sequencial (índice montado uma vez)
+    with instrumentacao.etapa('busca_imagens', len(itens_repetidos)) as etapa:
+        imagens = indice_imagens.obter()
+        for i, item in enumerate(itens_repetidos, 1):
+            item['imagem'] = imagens.get(i)
+            item['numero_item'] = i  # Adicionar número do item
+        etapa['saida'] = sum(1 for item in itens_repetidos if item['imagem'])
+    
+    if pasta_miniaturas:
+        with instrumentacao.etapa('miniaturas') as etapa:
+            miniaturas = gerar_miniaturas([item['imagem'] for item in itens_repetidos], pasta_miniaturas)
+            for item in itens_repetidos:
+                item['miniatura'] = miniaturas.get(item['imagem'])
+            etapa['saida'] = len(miniaturas)
+    
+    with instrumentacao.etapa('preparo_itens_html', len(itens_repetidos)):
+        if paginado:
+            # Itens vão como JSON; tabela e cards são montados no navegador
+            itens_html = [preparar_item_html(item, i, pasta_html) for i, item in enumerate(itens_repetidos, 1)]
+            linhas = cards = ()
+        else:
+            # Escapar e formatar cada item uma única vez (usado pela tabela e pelos cards)
+            itens_html = [preparar_item_html(item, i, pasta_html) for i, item in enumerate(itens_repetidos, 1)]
+            linhas = (renderizar_linha_tabela(item_html) for item_html in itens_html)
+            cards = (renderizar_card_mobile(item_html) for item_html in itens_html)
     
     # Processar checklist
-    checklist_data = processar_checklist()
-    html_checklist = criar_html_checklist(checklist_data)
+    with instrumentacao.etapa('checklist') as etapa:
+        checklist_data = processar_checklist()
+        etapa['saida'] = len(checklist_data) if checklist_data else 0
     
-    html_content = f"""<!DOCTYPE html>
+    yield f"""<!DOCTYPE html>
 <html lang="pt-BR">
 <head>
     <meta charset="UTF-8">
@@ -864,12 +2757,22 @@ def criar_html_cotacao(itens_agrupados):
                 <div class="tabs">
                     <button class="tab-button active" onclick="showTab('insumos')">Insumos</button>
                     <button class="tab-button" onclick="showTab('checklist')">Checklist</button>
-                </div>
+"""
+    
+    if comparacao_precos is not None:
+        yield """                    <button class="tab-button" onclick="showTab('historico')">Histórico de Preços</button>
+"""
+    
+    yield """                </div>
             </div>
             
             <div id="insumos" class="tab-content active">
                 <h2 class="section-title">📊 Insumos Medição Dezembro</h2>
-                
+"""
+    
+    yield HTML_BUSCA
+    
+    yield """                
                 <div class="table-wrapper">
                     <table>
                     <thead>
@@ -886,49 +2789,9 @@ def criar_html_cotacao(itens_agrupados):
 """
     
     # Adicionar itens repetidos
-    for i, item in enumerate(itens_repetidos, 1):
-        desc_escaped = html.escape(item['descricao'])
-        unidade_escaped = html.escape(str(item.get('unidade', 'UN')))
-        imagem = item.get('imagem', None)
-        numero_item = item.get('numero_item', i)
-        
-        # Se tiver imagem, adicionar tooltip
-        if imagem:
-            imagem_escaped = html.escape(imagem)
-            html_content += f"""
-                    <tr>
-                        <td><strong>#{numero_item}</strong></td>
-                        <td class="descricao item-com-imagem">
-                            {desc_escaped}
-                            <span class="icon-imagem">📷</span>
-                            <div class="tooltip">
-                                <img src="{imagem_escaped}" alt="Imagem do item #{numero_item}" onerror="this.style.display='none'; this.parentElement.querySelector('.tooltip-text').textContent='Imagem #{numero_item} não encontrada';">
-                                <div class="tooltip-text">Item #{numero_item}: {desc_escaped[:50]}...</div>
-                            </div>
-                        </td>
-                        <td class="number">
-                            <span class="quantidade-badge">{item.get('quantidade_total', item['quantidade'])}</span>
-                        </td>
-                        <td class="number">{unidade_escaped}</td>
-                        <td class="number">R$ {item['valor_unitario']:,.2f}</td>
-                        <td class="number"><strong>R$ {item['valor_total']:,.2f}</strong></td>
-                    </tr>
-"""
-        else:
-            html_content += f"""
-                    <tr>
-                        <td><strong>#{numero_item}</strong></td>
-                        <td class="descricao">{desc_escaped}</td>
-                        <td class="number">
-                            <span class="quantidade-badge">{item.get('quantidade_total', item['quantidade'])}</span>
-                        </td>
-                        <td class="number">{unidade_escaped}</td>
-                        <td class="number">R$ {item['valor_unitario']:,.2f}</td>
-                        <td class="number"><strong>R$ {item['valor_total']:,.2f}</strong></td>
-                    </tr>
-"""
+    yield from linhas
     
-    html_content += f"""
+    yield f"""
                     </tbody>
                 </table>
                 </div>
@@ -938,67 +2801,36 @@ def criar_html_cotacao(itens_agrupados):
 """
     
     # Adicionar cards mobile
-    for i, item in enumerate(itens_repetidos, 1):
-        desc_escaped = html.escape(item['descricao'])
-        unidade_escaped = html.escape(str(item.get('unidade', 'UN')))
-        imagem = item.get('imagem', None)
-        numero_item = item.get('numero_item', i)
-        
-        # Se tiver imagem, adicionar tooltip
-        if imagem:
-            imagem_escaped = html.escape(imagem)
-            html_content += f"""
-                    <div class="mobile-card">
-                        <div class="mobile-card-header">
-                            <span class="mobile-card-title">#{numero_item}</span>
-                            <span class="quantidade-badge">{item.get('quantidade_total', item['quantidade'])} {unidade_escaped}</span>
-                        </div>
-                        <div class="mobile-card-content">
-                            <span class="mobile-card-label">Valor Unitário:</span>
-                            <span class="mobile-card-value">R$ {item['valor_unitario']:,.2f}</span>
-                            <span class="mobile-card-label">Valor Total:</span>
-                            <span class="mobile-card-value"><strong>R$ {item['valor_total']:,.2f}</strong></span>
-                        </div>
-                        <div class="mobile-card-desc item-com-imagem">
-                            {desc_escaped}
-                            <span class="icon-imagem">📷</span>
-                            <div class="tooltip">
-                                <img src="{imagem_escaped}" alt="Imagem do item #{numero_item}" onerror="this.style.display='none'; this.parentElement.querySelector('.tooltip-text').textContent='Imagem #{numero_item} não encontrada';">
-                                <div class="tooltip-text">Item #{numero_item}: {desc_escaped[:50]}...</div>
-                            </div>
-                        </div>
-                    </div>
-"""
-        else:
-            html_content += f"""
-                    <div class="mobile-card">
-                        <div class="mobile-card-header">
-                            <span class="mobile-card-title">#{numero_item}</span>
-                            <span class="quantidade-badge">{item.get('quantidade_total', item['quantidade'])} {unidade_escaped}</span>
-                        </div>
-                        <div class="mobile-card-content">
-                            <span class="mobile-card-label">Valor Unitário:</span>
-                            <span class="mobile-card-value">R$ {item['valor_unitario']:,.2f}</span>
-                            <span class="mobile-card-label">Valor Total:</span>
-                            <span class="mobile-card-value"><strong>R$ {item['valor_total']:,.2f}</strong></span>
-                        </div>
-                        <div class="mobile-card-desc">
-                            {desc_escaped}
-                        </div>
-                    </div>
-"""
+    yield from cards
     
-    html_content += """
+    yield """
                 </div>
-            </div>
+"""
+    
+    if paginado:
+        yield HTML_CONTROLES_PAGINACAO
+    
+    yield from gerar_script_busca(itens_repetidos)
+    
+    yield """            </div>
             
             <div id="checklist" class="tab-content">
                 <h2 class="section-title">✅ Checklist da Obra</h2>
                 <div id="checklist-content">
-                    PLACEHOLDER_CHECKLIST_HTML
+                    """
+    
+    # Checklist inserido diretamente na sua posição do documento
+    yield from gerar_html_checklist(checklist_data)
+    
+    yield """
                 </div>
             </div>
-        </div>
+"""
+    
+    if comparacao_precos is not None:
+        yield from gerar_html_historico(itens_repetidos, comparacao_precos)
+    
+    yield """        </div>
     </div>
     
     <script>
@@ -1020,7 +2852,13 @@ def criar_html_cotacao(itens_agrupados):
             event.target.classList.add('active');
         }}
         
-        // Melhorar posicionamento dos tooltips e suporte mobile
+"""
+    
+    if paginado:
+        yield from gerar_script_paginado(itens_html, itens_por_pagina)
+        return
+    
+    yield """        // Melhorar posicionamento dos tooltips e suporte mobile
         document.addEventListener('DOMContentLoaded', function() {{
             const itemsComImagem = document.querySelectorAll('.item-com-imagem');
             let activeTooltip = null;
@@ -1105,48 +2943,439 @@ def criar_html_cotacao(itens_agrupados):
 </body>
 </html>
 """
-    
-    # Substituir placeholder pelo HTML do checklist
-    html_content = html_content.replace('PLACEHOLDER_CHECKLIST_HTML', html_checklist)
-    
-    return html_content
 
-# Processar
-print("Processando planilha para identificar itens repetidos...")
-print("="*60)
+def criar_html_cotacao(itens_agrupados, **opcoes):
+    """Cria página HTML focada em cotação"""
+    return ''.join(gerar_html_cotacao(itens_agrupados, **opcoes))
+
+def salvar_html_cotacao(itens_agrupados, caminho='itens_cotacao_dartagnan.html', **opcoes):
+    """Escreve a página HTML de cotação direto no arquivo, parte por parte"""
+    # Imagens referenciadas a partir da pasta da página (ex.: -o saida)
+    opcoes.setdefault('pasta_html', os.path.dirname(caminho))
+    with open(caminho, 'w', encoding='utf-8') as f:
+        for parte in gerar_html_cotacao(itens_agrupados, **opcoes):
+            f.write(parte)
+
+def salvar_csv_cotacao(itens_agrupados, caminho='itens_cotacao_dartagnan.csv'):
+    """Exporta os itens agrupados para CSV (compatível com Excel)"""
+    import pandas as pd
+
+    df_csv = pd.DataFrame(itens_agrupados)
+    df_csv = df_csv[['descricao', 'quantidade_total', 'unidade', 'valor_unitario', 'valor_total']]
+    df_csv.columns = ['Descrição', 'Quantidade', 'Unidade', 'Valor Unitário (R$)', 'Valor Total (R$)']
+    df_csv.to_csv(caminho, index=False, encoding='utf-8-sig')
+
+def salvar_parquet_cotacao(itens_agrupados, caminho='itens_cotacao_dartagnan.parquet', planilha=None):
+    """Exporta os itens agrupados para Parquet, com os valores de cada ocorrência.
+
+    Além das colunas do CSV, inclui o número de ocorrências e a lista `valores`.
+    Os metadados da execução (planilha, data, versão das regras) ficam nos
+    metadados do schema, na chave 'cotacao'. Requer pyarrow.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Exportação Parquet requer o pacote pyarrow (pip install pyarrow)") from e
+
+    schema = pa.schema([
+        ('descricao', pa.string()),
+        ('quantidade', pa.int64()),  # Ocorrências na planilha
+        ('quantidade_total', pa.float64()),
+        ('unidade', pa.string()),
+        ('valor_unitario', pa.float64()),
+        ('valor_total', pa.float64()),
+        ('valores', pa.list_(pa.float64())),
+    ])
+    colunas = {
+        nome: [item[nome] for item in itens_agrupados]
+        for nome in schema.names
+    }
+    metadados = {
+        'planilha': os.path.basename(planilha) if planilha else None,
+        'gerado_em': datetime.now().isoformat(timespec='seconds'),
+        'versao_regras': VERSAO_REGRAS,
+        'itens': len(itens_agrupados),
+        'valor_total': somar_reais([item['valor_total'] for item in itens_agrupados]),
+    }
+    schema = schema.with_metadata({'cotacao': json.dumps(metadados, ensure_ascii=False)})
+
+    tabela = pa.Table.from_pydict(colunas, schema=schema)
+    pq.write_table(tabela, caminho, compression='zstd')
+
+def exibir_resumo(itens_agrupados):
+    """Imprime estatísticas e os itens mais repetidos"""
+    # Incluir TODOS os itens (repetidos e únicos)
+    itens_repetidos = itens_agrupados
+
+    print(f"\n✅ Itens processados: {len(itens_agrupados)}")
+    print(f"✅ Total de itens (repetidos e únicos): {len(itens_repetidos)}")
+
+    if itens_repetidos:
+        # Separar repetidos e únicos para estatísticas
+        repetidos = [item for item in itens_repetidos if item['quantidade'] > 1]
+        unicos = [item for item in itens_repetidos if item['quantidade'] == 1]
+        print(f"\n📊 Estatísticas:")
+        print(f"   - Itens repetidos: {len(repetidos)}")
+        print(f"   - Itens únicos: {len(unicos)}")
+        print(f"\n📊 Top 10 itens mais repetidos:")
+        for i, item in enumerate(sorted(repetidos, key=lambda x: x['quantidade'], reverse=True)[:10], 1):
+            print(f"   {i}. {item['descricao'][:60]}... - {item['quantidade']}x")
+
+def subtotais_por_secao(itens_agrupados):
+    """Soma, por aba/seção, os valores dos itens agrupados (maior subtotal primeiro)"""
+    valores = {}
+    for item in itens_agrupados:
+        for secao, valor in item.get('secoes', {}).items():
+            valores.setdefault(secao, []).append(valor)
+    subtotais = {
+        secao: {'itens': len(valores_secao), 'valor_total': somar_reais(valores_secao)}
+        for secao, valores_secao in valores.items()
+    }
+    return dict(sorted(subtotais.items(), key=lambda par: par[1]['valor_total'], reverse=True))
+
+def exibir_subtotais(subtotais):
+    """Imprime o subtotal de cada aba/seção"""
+    print(f"\n📊 Subtotais por aba ({len(subtotais)}):")
+    for secao, subtotal in subtotais.items():
+        print(f"   - {secao}: {subtotal['itens']} itens - {formatar_reais(subtotal['valor_total'])}")
+
+def salvar_csv_subtotais(subtotais, caminho):
+    """Exporta os subtotais por aba/seção para CSV"""
+    import csv
+
+    with open(caminho, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Seção', 'Itens', 'Valor Total (R$)'])
+        for secao, subtotal in subtotais.items():
+            writer.writerow([secao, subtotal['itens'], subtotal['valor_total']])
+
+FORMATOS_SAIDA = ['html', 'csv', 'parquet']
+FORMATOS_PADRAO = ['html', 'csv']
+
+def listar_planilhas_lote(padrao):
+    """Lista as planilhas de um lote (pasta ou padrão glob), ignorando checklist e temporários do Excel"""
+    if os.path.isdir(padrao):
+        # CSVs só entram por padrão explícito: a pasta pode conter as saídas de execuções anteriores
+        caminhos = [c for extensao in EXTENSOES_CALAMINE for c in glob.glob(os.path.join(padrao, '*' + extensao))]
+    else:
+        caminhos = glob.glob(padrao)
+    planilhas = []
+    for caminho in sorted(caminhos):
+        nome = os.path.basename(caminho)
+        if nome.startswith('~$') or nome in ARQUIVOS_CHECKLIST or not os.path.isfile(caminho):
+            continue
+        planilhas.append(caminho)
+    return planilhas
+
+def nome_base_planilha(caminho):
+    """Nome base dos arquivos gerados para uma planilha (ex.: Dartagnan.xlsx -> itens_cotacao_dartagnan)"""
+    nome = os.path.splitext(os.path.basename(caminho))[0]
+    return 'itens_cotacao_' + (re.sub(r'\W+', '_', nome.lower()).strip('_') or 'planilha')
+
+def nomes_base_lote(planilhas):
+    """{caminho: nome base} sem repetições (ex.: "Obra A.xlsx" e "obra_a.xlsx" → ..._obra_a e ..._obra_a_2)"""
+    nomes = {}
+    usados = set()
+    for caminho in planilhas:
+        base = nome = nome_base_planilha(caminho)
+        sufixo = 1
+        while nome in usados:
+            sufixo += 1
+            nome = f'{base}_{sufixo}'
+        usados.add(nome)
+        nomes[caminho] = nome
+    return nomes
+
+def processar_arquivo_lote(caminho, pasta_saida, formatos, cache=None, caminho_armazem=None,
+                           caminho_historico=None, data_medicao=None, fundir_similares=None,
+                           todas_abas=False, nome=None, opcoes_html=None):
+    """Processa uma planilha do lote (executado em um processo separado).
+
+    `nome` é o nome base das saídas (padrão: nome_base_planilha(caminho)).
+    `opcoes_html` são repassadas a salvar_html_cotacao (--paginado, --miniaturas).
+    """
+    resumo = {'planilha': caminho, 'itens': 0, 'itens_repetidos': 0, 'valor_total': 0.0,
+              'saidas': {}, 'erro': None}
+    try:
+        # Silenciar os prints do processamento (evita saída intercalada entre processos)
+        with contextlib.redirect_stdout(io.StringIO()):
+            armazem = ArmazemItensBrutos(caminho_armazem) if caminho_armazem else None
+            try:
+                itens_agrupados = processar_planilha_com_cache(caminho, cache, armazem, fundir_similares,
+                                                               todas_abas)
+            finally:
+                if armazem is not None:
+                    armazem.fechar()
+            comparacao_precos = None
+            if caminho_historico:
+                historico = HistoricoPrecos(caminho_historico)
+                try:
+                    execucao_id = historico.registrar(itens_agrupados, caminho, data_medicao)
+                    comparacao_precos = historico.precos_anteriores(itens_agrupados, data_medicao, execucao_id)
+                finally:
+                    historico.fechar()
+            nome = nome or nome_base_planilha(caminho)
+            saidas = {formato: caminho_saida(pasta_saida, nome, formato) for formato in formatos}
+            if 'html' in saidas:
+                salvar_html_cotacao(itens_agrupados, saidas['html'], comparacao_precos=comparacao_precos,
+                                    **(opcoes_html or {}))
+            if 'csv' in saidas:
+                salvar_csv_cotacao(itens_agrupados, saidas['csv'])
+            if 'parquet' in saidas:
+                salvar_parquet_cotacao(itens_agrupados, saidas['parquet'], caminho)
+            if todas_abas and 'csv' in saidas:
+                saidas['secoes'] = caminho_saida(pasta_saida, f'{nome}_secoes', 'csv')
+                salvar_csv_subtotais(subtotais_por_secao(itens_agrupados), saidas['secoes'])
+        resumo.update({
+            'itens': len(itens_agrupados),
+            'itens_repetidos': sum(1 for item in itens_agrupados if item['quantidade'] > 1),
+            'valor_total': somar_reais([item['valor_total'] for item in itens_agrupados]),
+            'saidas': saidas
+        })
+    except Exception as e:
+        resumo['erro'] = f'{type(e).__name__}: {e}'
+    return resumo
+
+def executar_lote(padrao, pasta_saida, formatos, processos=None, cache=None, caminho_armazem=None,
+                  caminho_historico=None, data_medicao=None, fundir_similares=None, todas_abas=False,
+                  opcoes_html=None):
+    """Processa várias planilhas em paralelo e grava um resumo consolidado"""
+    planilhas = listar_planilhas_lote(padrao)
+    if not planilhas:
+        print(f"❌ Nenhuma planilha encontrada em: {padrao}")
+        return 1
+
+    print(f"Processando {len(planilhas)} planilha(s) em lote...")
+    print("="*60)
+
+    # Planilhas com o mesmo nome normalizado não podem gravar nos mesmos arquivos
+    nomes = nomes_base_lote(planilhas)
+
+    # Ler Excel é CPU-bound: um processo por planilha (até o número de núcleos)
+    # Cada planilha já ocupa um processo: as abas são lidas em sequência dentro dele
+    with ProcessPoolExecutor(max_workers=processos, initializer=configurar_leitura,
+                             initargs=_opcoes_leitura()[:3] + (1,)) as executor:
+        futuros = [executor.submit(processar_arquivo_lote, caminho, pasta_saida, formatos, cache,
+                                   caminho_armazem, caminho_historico, data_medicao, fundir_similares,
+                                   todas_abas, nomes[caminho], opcoes_html)
+                   for caminho in planilhas]
+        resumos = [futuro.result() for futuro in futuros]
+
+    for resumo in resumos:
+        if resumo['erro']:
+            print(f"❌ {resumo['planilha']}: {resumo['erro']}")
+            continue
+        print(f"✅ {resumo['planilha']}: {resumo['itens']} itens "
+              f"({resumo['itens_repetidos']} repetidos) - {formatar_reais(resumo['valor_total'])}")
+        for caminho in resumo['saidas'].values():
+            print(f"   → {caminho}")
+
+    # Resumo consolidado de todas as planilhas
+    caminho_resumo = caminho_saida(pasta_saida, 'resumo_lote', 'csv')
+    salvar_resumo_lote(resumos, caminho_resumo)
+    total_geral = somar_reais([r['valor_total'] for r in resumos if not r['erro']])
+    print(f"\n📊 Total geral do lote: {formatar_reais(total_geral)}")
+    print(f"✅ Resumo do lote criado: {caminho_resumo}")
+
+    return 1 if any(r['erro'] for r in resumos) else 0
+
+def salvar_resumo_lote(resumos, caminho):
+    """Grava o resumo do lote (uma linha por planilha) em CSV"""
+    import csv
+
+    with open(caminho, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Planilha', 'Itens', 'Itens Repetidos', 'Valor Total (R$)', 'Erro'])
+        for resumo in resumos:
+            writer.writerow([resumo['planilha'], resumo['itens'], resumo['itens_repetidos'],
+                             resumo['valor_total'], resumo['erro'] or ''])
+
+def _limiar_similaridade(texto):
+    """Tipo do argparse para --fundir-similares: número entre 0 e 1"""
+    try:
+        limiar = float(texto)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"limiar inválido: {texto!r}")
+    if not 0 <= limiar <= 1:
+        raise argparse.ArgumentTypeError(f"o limiar deve estar entre 0 e 1 (recebido: {texto})")
+    return limiar
+
+def _inteiro_positivo(texto):
+    """Tipo do argparse para contagens: inteiro maior que zero"""
+    try:
+        valor = int(texto)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"número inteiro inválido: {texto!r}")
+    if valor < 1:
+        raise argparse.ArgumentTypeError(f"deve ser maior que zero (recebido: {texto})")
+    return valor
+
+def criar_parser_argumentos():
+    parser = argparse.ArgumentParser(
+        description='Agrupa os itens de uma planilha de medição e gera a página de cotação.'
+    )
+    parser.add_argument('planilha', nargs='?', default='Dartagnan.xlsx',
+                        help='planilha de medição: .xlsx, .xls, .ods ou .csv (padrão: Dartagnan.xlsx)')
+    parser.add_argument('--motor', choices=MOTORES_LEITURA, default='auto',
+                        help='biblioteca de leitura das planilhas; auto usa python-calamine quando instalado '
+                             '(mais rápido, lê também .xls/.ods) e openpyxl caso contrário (padrão: auto)')
+    parser.add_argument('-o', '--saida', default=None,
+                        help='pasta onde os arquivos gerados são salvos (padrão: pasta atual)')
+    parser.add_argument('-n', '--nome', default=None,
+                        help='nome base dos arquivos gerados (padrão: itens_cotacao_ + nome da planilha, '
+                             'ex.: itens_cotacao_dartagnan)')
+    parser.add_argument('-f', '--formatos', nargs='+', choices=FORMATOS_SAIDA, default=FORMATOS_PADRAO,
+                        help='saídas a gerar (padrão: html csv; parquet requer pyarrow)')
+    parser.add_argument('--lote', metavar='PASTA_OU_PADRAO',
+                        help='processa todas as planilhas de uma pasta ou padrão glob (ex.: "medicoes/*.xlsx")')
+    parser.add_argument('-j', '--processos', type=_inteiro_positivo, default=None,
+                        help='número de processos no modo lote (padrão: número de núcleos)')
+    parser.add_argument('--cache', nargs='?', const=PASTA_CACHE_PADRAO, default=None, metavar='PASTA',
+                        help='reaproveita o resultado de planilhas sem alterações e o layout de modelos já vistos '
+                             f'(padrão: {PASTA_CACHE_PADRAO})')
+    parser.add_argument('--cache-max-mb', type=float, default=TAMANHO_MAXIMO_CACHE / (1024 * 1024),
+                        help='tamanho máximo do cache em MB (padrão: %(default)g)')
+    parser.add_argument('--layouts', default=ARQUIVO_LAYOUTS_MANUAIS, metavar='ARQUIVO',
+                        help='JSON com a linha do cabeçalho e as colunas de modelos que a detecção erra '
+                             f'(padrão: {ARQUIVO_LAYOUTS_MANUAIS}, se existir)')
+    parser.add_argument('--armazem', nargs='?', const=ARMAZEM_PADRAO, default=None, metavar='ARQUIVO',
+                        help='guarda os itens brutos das planilhas em SQLite e os reutiliza, sem reler o Excel '
+                             f'(padrão: {ARMAZEM_PADRAO})')
+    parser.add_argument('--todas-abas', action='store_true',
+                        help='lê todas as abas (uma por obra/seção) em paralelo e consolida a cotação, '
+                             'com subtotais por aba')
+    parser.add_argument('--fundir-similares', nargs='?', type=_limiar_similaridade, const=LIMIAR_SIMILARIDADE, default=None,
+                        metavar='LIMIAR',
+                        help='funde descrições quase iguais (espaços, acentos, pontuação, pequenas variações) '
+                             f'antes de agrupar (limiar padrão: {LIMIAR_SIMILARIDADE})')
+    parser.add_argument('--historico', nargs='?', const=HISTORICO_PADRAO, default=None, metavar='ARQUIVO',
+                        help='registra os preços em SQLite e mostra na página a variação em relação à medição '
+                             f'anterior (padrão: {HISTORICO_PADRAO})')
+    parser.add_argument('--data-medicao', type=date.fromisoformat, default=None, metavar='AAAA-MM-DD',
+                        help='data da medição registrada no histórico (padrão: hoje)')
+    parser.add_argument('--paginado', nargs='?', type=_inteiro_positivo, const=ITENS_POR_PAGINA, default=None,
+                        metavar='ITENS_POR_PAGINA',
+                        help=f'HTML com itens em JSON, exibidos por página (padrão: {ITENS_POR_PAGINA} por página); '
+                             'indicado para cotações com milhares de itens')
+    parser.add_argument('--miniaturas', nargs='?', const=PASTA_MINIATURAS_PADRAO, default=None, metavar='PASTA',
+                        help=f'usa miniaturas WebP ou JPEG (geradas com Pillow) nos tooltips (padrão: {PASTA_MINIATURAS_PADRAO})')
+    parser.add_argument('--perfil', nargs='?', const='', default=None, metavar='ARQUIVO_JSON',
+                        help='mede tempo, pico de memória (tracemalloc) e linhas de entrada/saída de cada etapa '
+                             'e mostra uma tabela; com ARQUIVO_JSON, salva também em JSON. Os tempos incluem '
+                             'o custo do tracemalloc (não se aplica ao modo --lote)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='apenas mostra o que seria feito, sem ler a planilha')
+    return parser
+
+def caminho_saida(pasta, nome, extensao):
+    arquivo = f'{nome}.{extensao}'
+    return os.path.join(pasta, arquivo) if pasta else arquivo
+
+def main(argv=None):
+    args = criar_parser_argumentos().parse_args(argv)
+    # Layouts ficam numa subpasta do cache: fora das entradas removidas por tamanho
+    configurar_leitura(args.motor, os.path.join(args.cache, 'layouts') if args.cache else None, args.layouts)
+
+    cache = None
+    if args.cache:
+        cache = CacheResultados(args.cache, int(args.cache_max_mb * 1024 * 1024))
+
+    opcoes_html = {'pasta_miniaturas': args.miniaturas}
+    if args.paginado is not None:
+        opcoes_html.update(paginado=True, itens_por_pagina=args.paginado)
+
+    if args.lote:
+        if args.dry_run:
+            for caminho, nome in nomes_base_lote(listar_planilhas_lote(args.lote)).items():
+                print(f"Planilha: {caminho} → {caminho_saida(args.saida, nome, '*')}")
+            return 0
+        if args.saida:
+            os.makedirs(args.saida, exist_ok=True)
+        return executar_lote(args.lote, args.saida, args.formatos, args.processos, cache, args.armazem,
+                             args.historico, args.data_medicao, args.fundir_similares, args.todas_abas,
+                             opcoes_html)
+
+    if args.nome is None:
+        # Como no modo lote: outra planilha não sobrescreve as saídas da Dartagnan
+        args.nome = nome_base_planilha(args.planilha)
+    saidas = {formato: caminho_saida(args.saida, args.nome, formato) for formato in args.formatos}
+
+    if args.dry_run:
+        print(f"Planilha: {args.planilha}{'' if os.path.exists(args.planilha) else ' (não encontrada)'}")
+        for formato, caminho in saidas.items():
+            print(f"  {formato.upper()}: {caminho}")
+        return 0
+
+    if args.saida:
+        os.makedirs(args.saida, exist_ok=True)
+
+    if args.perfil is not None:
+        instrumentacao.ativar()
+
+    # Processar
+    print("Processando planilha para identificar itens repetidos...")
+    print("="*60)
+
+    armazem = ArmazemItensBrutos(args.armazem) if args.armazem else None
+    try:
+        with instrumentacao.etapa('processamento') as etapa:
+            itens_agrupados = processar_planilha_com_cache(args.planilha, cache, armazem,
+                                                           args.fundir_similares, args.todas_abas)
+            etapa['saida'] = len(itens_agrupados)
+    finally:
+        if armazem is not None:
+            armazem.fechar()
 
-itens_agrupados = processar_planilha_para_cotacao()
+    exibir_resumo(itens_agrupados)
+    if args.todas_abas:
+        subtotais = subtotais_por_secao(itens_agrupados)
+        exibir_subtotais(subtotais)
 
-# Incluir TODOS os itens (repetidos e únicos)
-itens_repetidos = itens_agrupados
+    comparacao_precos = None
+    if args.historico:
+        historico = HistoricoPrecos(args.historico)
+        try:
+            with instrumentacao.etapa('historico_precos', len(itens_agrupados)) as etapa:
+                execucao_id = historico.registrar(itens_agrupados, args.planilha, args.data_medicao)
+                comparacao_precos = historico.precos_anteriores(itens_agrupados, args.data_medicao, execucao_id)
+                etapa['saida'] = len(comparacao_precos)
+        finally:
+            historico.fechar()
+        print(f"\n📈 Histórico de preços atualizado: {args.historico} "
+              f"({len(comparacao_precos)} itens com preço anterior)")
 
-print(f"\n✅ Itens processados: {len(itens_agrupados)}")
-print(f"✅ Total de itens (repetidos e únicos): {len(itens_repetidos)}")
+    if 'html' in saidas:
+        # Criar e salvar HTML (escrita em streaming)
+        with instrumentacao.etapa('html', len(itens_agrupados)):
+            salvar_html_cotacao(itens_agrupados, saidas['html'], comparacao_precos=comparacao_precos,
+                                **opcoes_html)
+        print(f"\n✅ Página HTML criada: {saidas['html']}")
 
-if itens_repetidos:
-    # Separar repetidos e únicos para estatísticas
-    repetidos = [item for item in itens_repetidos if item['quantidade'] > 1]
-    unicos = [item for item in itens_repetidos if item['quantidade'] == 1]
-    print(f"\n📊 Estatísticas:")
-    print(f"   - Itens repetidos: {len(repetidos)}")
-    print(f"   - Itens únicos: {len(unicos)}")
-    print(f"\n📊 Top 10 itens mais repetidos:")
-    for i, item in enumerate(sorted(repetidos, key=lambda x: x['quantidade'], reverse=True)[:10], 1):
-        print(f"   {i}. {item['descricao'][:60]}... - {item['quantidade']}x")
+    if 'csv' in saidas:
+        # Gerar CSV também
+        with instrumentacao.etapa('csv', len(itens_agrupados)):
+            salvar_csv_cotacao(itens_agrupados, saidas['csv'])
+        print(f"✅ Arquivo CSV criado: {saidas['csv']}")
 
-# Criar HTML
-html_content = criar_html_cotacao(itens_agrupados)
+    if 'parquet' in saidas:
+        with instrumentacao.etapa('parquet', len(itens_agrupados)):
+            salvar_parquet_cotacao(itens_agrupados, saidas['parquet'], args.planilha)
+        print(f"✅ Arquivo Parquet criado: {saidas['parquet']}")
 
-# Salvar
-with open('itens_cotacao_dartagnan.html', 'w', encoding='utf-8') as f:
-    f.write(html_content)
+    if args.todas_abas and 'csv' in saidas:
+        caminho_subtotais = caminho_saida(args.saida, f'{args.nome}_secoes', 'csv')
+        salvar_csv_subtotais(subtotais, caminho_subtotais)
+        print(f"✅ Subtotais por aba criados: {caminho_subtotais}")
 
-print(f"\n✅ Página HTML criada: itens_cotacao_dartagnan.html")
+    if instrumentacao.ativa:
+        instrumentacao.desativar()
+        instrumentacao.exibir_tabela()
+        if args.perfil:
+            instrumentacao.salvar_json(args.perfil)
+            print(f"✅ Perfil salvo: {args.perfil}")
 
-# Gerar CSV também
-df_csv = pd.DataFrame(itens_repetidos)
-df_csv = df_csv[['descricao', 'quantidade_total', 'unidade', 'valor_unitario', 'valor_total']]
-df_csv.columns = ['Descrição', 'Quantidade', 'Unidade', 'Valor Unitário (R$)', 'Valor Total (R$)']
-df_csv.to_csv('itens_cotacao_dartagnan.csv', index=False, encoding='utf-8-sig')
-print(f"✅ Arquivo CSV criado: itens_cotacao_dartagnan.csv")
+    return 0
 
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,121 @@
+"""Compara a extração de itens antiga (dois loops iterrows) com a versão vetorizada
+
+Uso:
+    python benchmarks/bench_extracao.py [linhas ...]
+"""
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agrupar_itens_cotacao import extrair_itens  # noqa: E402
+
+DESCRICOES = [
+    'TUBO PVC SOLDAVEL DN 25MM, FORNECIDO E INSTALADO AF_06/2014',
+    'PORTA DE MADEIRA 80X210 CM',
+    'PINTURA ACRILICA EM PAREDES, DUAS DEMAOS',
+    'REGISTRO DE GAVETA BRUTO 3/4"',
+    'Tomada 2P+T 10A NBR 14136',
+    'Caixa sifonada de PVC',
+]
+
+def gerar_dataframe(n_linhas, semente=42):
+    """Gera um DataFrame com o formato da planilha de medição"""
+    rnd = random.Random(semente)
+    linhas = []
+    for i in range(n_linhas):
+        r = rnd.random()
+        if r < 0.05:
+            linhas.append([None, 'TOTAL GERAL', None, None, rnd.random() * 1e5])
+        elif r < 0.1:
+            linhas.append([str(i), 'Guarita', None, None, None])
+        else:
+            linhas.append([
+                str(i),
+                rnd.choice(DESCRICOES),
+                rnd.choice(['M', 'UN', 'M²', None]),
+                round(rnd.random() * 50, 2) if rnd.random() > 0.05 else None,
+                rnd.choice([0, None, round(rnd.random() * 1000, 2), 'x']),
+            ])
+    return pd.DataFrame(linhas, columns=['Item', 'Descrição', 'Und', 'Quant', 'Total'])
+
+def extrair_itens_iterrows(df_header, col_descricao, col_total, col_unidade, col_quantidade):
+    """Implementação anterior, com dois loops iterrows (referência)"""
+    todos_itens_raw = []
+    for idx, row in df_header.iterrows():
+        desc_val = row[col_descricao] if pd.notna(row[col_descricao]) else None
+        total_val = row[col_total] if pd.notna(row[col_total]) else None
+        unidade_val = row[col_unidade] if col_unidade and pd.notna(row[col_unidade]) else None
+        quantidade_val = row[col_quantidade] if col_quantidade and pd.notna(row[col_quantidade]) else None
+        if pd.isna(desc_val):
+            continue
+        desc_str = str(desc_val).strip()
+        if desc_str.lower() in ['descrição', 'descricao', 'obra', 'nan', '']:
+            continue
+        if 'total' in desc_str.lower() or 'geral' in desc_str.lower():
+            continue
+        valor = 0
+        if pd.notna(total_val):
+            try:
+                valor = float(total_val)
+                if pd.isna(valor):
+                    valor = 0
+            except:
+                valor = 0
+        unidade = str(unidade_val).strip() if pd.notna(unidade_val) else None
+        quantidade = None
+        if pd.notna(quantidade_val):
+            try:
+                quantidade = float(quantidade_val)
+                if pd.isna(quantidade):
+                    quantidade = None
+            except:
+                quantidade = None
+        unidade_valida = unidade and unidade.lower() not in ['nan', 'none', '', 'undefined']
+        quantidade_valida = quantidade is not None and not pd.isna(quantidade)
+        if unidade_valida and quantidade_valida:
+            todos_itens_raw.append({
+                'descricao': desc_str,
+                'valor': valor,
+                'unidade': unidade,
+                'quantidade': quantidade
+            })
+
+    todas_descricoes_planilha = []
+    for idx, row in df_header.iterrows():
+        desc_val = row[col_descricao] if pd.notna(row[col_descricao]) else None
+        if pd.isna(desc_val):
+            continue
+        desc_str = str(desc_val).strip()
+        if desc_str.lower() not in ['descrição', 'descricao', 'obra', 'nan', '']:
+            if 'total' not in desc_str.lower() and 'geral' not in desc_str.lower():
+                todas_descricoes_planilha.append(desc_str)
+
+    return todos_itens_raw, Counter(todas_descricoes_planilha)
+
+def cronometrar(funcao, *args):
+    inicio = time.perf_counter()
+    resultado = funcao(*args)
+    return time.perf_counter() - inicio, resultado
+
+def main():
+    tamanhos = [int(n) for n in sys.argv[1:]] or [1000, 10000, 50000]
+    colunas = ('Descrição', 'Total', 'Und', 'Quant')
+
+    print(f"{'Linhas':>8} | {'iterrows (s)':>12} | {'vetorizado (s)':>14} | {'Ganho':>6}")
+    print('-' * 50)
+    for n in tamanhos:
+        df = gerar_dataframe(n)
+        t_antigo, esperado = cronometrar(extrair_itens_iterrows, df, *colunas)
+        t_novo, (itens, contador) = cronometrar(extrair_itens, df, *colunas)
+        obtido = (itens.para_dicts(), contador)
+        assert obtido == esperado, 'resultado diferente da implementação anterior'
+        print(f"{n:>8} | {t_antigo:>12.3f} | {t_novo:>14.3f} | {t_antigo / t_novo:>5.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""Compara os motores de leitura de planilhas (openpyxl x python-calamine)
+
+Usa as mesmas planilhas sintéticas de bench_pipeline.py e confere que os dois
+motores produzem o mesmo DataFrame. A referência é o pd.read_excel original.
+
+Uso:
+    python benchmarks/bench_leitura.py [linhas ...]
+"""
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import agrupar_itens_cotacao as cotacao  # noqa: E402
+from bench_pipeline import obter_planilha  # noqa: E402
+
+def cronometrar(funcao, *args, **kwargs):
+    inicio = time.perf_counter()
+    resultado = funcao(*args, **kwargs)
+    return time.perf_counter() - inicio, resultado
+
+def carregar_com_motor(caminho, motor):
+    cotacao.leitor_planilhas.motor = motor
+    return cotacao.carregar_planilha(caminho)
+
+def main():
+    tamanhos = [int(n) for n in sys.argv[1:]] or [1000, 10000, 100000]
+    if not cotacao.LeitorPlanilhas.calamine_disponivel():
+        print("⚠️  python-calamine não instalado (pip install python-calamine): medindo só o openpyxl")
+
+    print(f"{'Linhas':>8} | {'read_excel (s)':>14} | {'openpyxl (s)':>12} | {'calamine (s)':>12} | {'Ganho':>6}")
+    print('-' * 66)
+    for n in tamanhos:
+        caminho = obter_planilha(n)
+        t_referencia, referencia = cronometrar(pd.read_excel, caminho, header=2)
+        t_openpyxl, df_openpyxl = cronometrar(carregar_com_motor, caminho, 'openpyxl')
+        pd.testing.assert_frame_equal(df_openpyxl, referencia)
+
+        if cotacao.LeitorPlanilhas.calamine_disponivel():
+            t_calamine, df_calamine = cronometrar(carregar_com_motor, caminho, 'calamine')
+            pd.testing.assert_frame_equal(df_calamine, referencia)
+            print(f"{n:>8} | {t_referencia:>14.3f} | {t_openpyxl:>12.3f} | {t_calamine:>12.3f} | "
+                  f"{t_referencia / t_calamine:>5.1f}x")
+        else:
+            print(f"{n:>8} | {t_referencia:>14.3f} | {t_openpyxl:>12.3f} | {'-':>12} | "
+                  f"{t_referencia / t_openpyxl:>5.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Compara a memória dos itens brutos: lista de dicts (anterior) x ItensBrutos (colunas NumPy)
+
+Usa as planilhas sintéticas de bench_pipeline.py. Para cada representação, a
+planilha é lida com o tracemalloc ligado e, depois de descartar o DataFrame,
+mede-se quanto continua alocado só por causa dos itens extraídos.
+
+Uso:
+    python benchmarks/bench_memoria.py [linhas ...]
+"""
+import gc
+import os
+import sys
+import tracemalloc
+from collections import Counter
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import agrupar_itens_cotacao as cotacao  # noqa: E402
+from bench_pipeline import obter_planilha  # noqa: E402
+
+def extrair_itens_dicts(df_header, col_descricao, col_total, col_unidade, col_quantidade):
+    """Implementação anterior: um dict por item (referência)"""
+    descricoes = df_header[col_descricao]
+    descricoes = descricoes[descricoes.notna()].astype(str).str.strip()
+    desc_lower = descricoes.str.lower()
+    mascara_desc = ~desc_lower.isin(['descrição', 'descricao', 'obra', 'nan', ''])
+    mascara_desc &= ~(desc_lower.str.contains('total', regex=False) |
+                      desc_lower.str.contains('geral', regex=False))
+    descricoes = descricoes[mascara_desc]
+    contador_todos = Counter(descricoes.tolist())
+
+    linhas = descricoes.index
+    unidades = df_header.loc[linhas, col_unidade]
+    unidades_validas = unidades.notna()
+    unidades = unidades[unidades_validas].astype(str).str.strip()
+    unidades_validas[unidades_validas] = ~unidades.str.lower().isin(['nan', 'none', '', 'undefined'])
+    quantidades = pd.to_numeric(df_header.loc[linhas, col_quantidade], errors='coerce')
+    valores = pd.to_numeric(df_header.loc[linhas, col_total], errors='coerce').fillna(0)
+
+    linhas = linhas[(unidades_validas & quantidades.notna()).to_numpy()]
+    todos_itens_raw = [
+        {'descricao': descricao, 'valor': valor, 'unidade': unidade, 'quantidade': quantidade}
+        for descricao, valor, unidade, quantidade in zip(
+            descricoes.loc[linhas].tolist(), valores.loc[linhas].tolist(),
+            unidades.loc[linhas].tolist(), quantidades.loc[linhas].tolist()
+        )
+    ]
+    return todos_itens_raw, contador_todos
+
+def medir_memoria(caminho, extrair):
+    """(bytes mantidos pelos itens, número de itens)"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        linhas = cotacao.ler_linhas_planilha(caminho)
+        header_row = cotacao.localizar_linha_cabecalho(linhas)
+        df_header = cotacao._montar_dataframe(linhas, header_row)
+        del linhas
+        colunas = cotacao.identificar_colunas(df_header)
+        itens, contador_todos = extrair(df_header, *colunas)
+        del df_header, contador_todos
+        gc.collect()
+        mantido = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return mantido, len(itens)
+
+def main():
+    tamanhos = [int(n) for n in sys.argv[1:]] or [1000, 10000, 100000]
+
+    print(f"{'Linhas':>8} | {'Itens':>7} | {'dicts (MB)':>10} | {'colunas (MB)':>12} | {'Redução':>7}")
+    print('-' * 58)
+    for n in tamanhos:
+        caminho = obter_planilha(n)
+        mem_dicts, total = medir_memoria(caminho, extrair_itens_dicts)
+        mem_colunas, total_colunas = medir_memoria(caminho, cotacao.extrair_itens)
+        assert total == total_colunas, 'número de itens diferente entre as representações'
+        print(f"{n:>8} | {total:>7} | {mem_dicts / 1e6:>10.2f} | {mem_colunas / 1e6:>12.2f} | "
+              f"{mem_dicts / mem_colunas:>6.1f}x")
+
+if __name__ == '__main__':
+    main()
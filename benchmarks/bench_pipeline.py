@@ -0,0 +1,232 @@
+"""Mede as etapas do processamento com planilhas sintéticas no formato das medições
+
+Gera (uma vez) planilhas com 1k, 10k e 100k linhas: cabeçalho 'Item'/'Descrição'/'Und'/
+'Quant'/'Total' na linha 3, linhas de categoria, linhas de total e descrições SINAPI
+repetidas. Cronometra separadamente processar_planilha_para_cotacao, criar_html_cotacao
+e a exportação CSV, e compara com o baseline em JSON (ou grava um novo com --salvar).
+O baseline depende da máquina e fica fora do git (.gitignore).
+
+Uso:
+    python benchmarks/bench_pipeline.py                      # compara com o baseline
+    python benchmarks/bench_pipeline.py --salvar             # grava/atualiza o baseline
+    python benchmarks/bench_pipeline.py --linhas 1000 10000 --repeticoes 5
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+PASTA_BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(PASTA_BENCHMARKS))
+
+from agrupar_itens_cotacao import (  # noqa: E402
+    criar_html_cotacao,
+    processar_planilha_para_cotacao,
+    salvar_csv_cotacao,
+)
+
+# Incrementar quando o formato das planilhas geradas mudar (invalida as planilhas em cache)
+VERSAO_GERADOR = '1'
+PASTA_DADOS = os.path.join(PASTA_BENCHMARKS, '.dados')
+BASELINE_PADRAO = os.path.join(PASTA_BENCHMARKS, 'baseline_pipeline.json')
+TAMANHOS_PADRAO = [1000, 10000, 100000]
+ETAPAS = ['processar', 'html', 'csv']
+
+DESCRICOES_SINAPI = [
+    'TUBO, PVC, SOLDÁVEL, DN {d}MM, INSTALADO EM RAMAL DE DISTRIBUIÇÃO DE ÁGUA - FORNECIMENTO E INSTALAÇÃO. AF_06/2022',
+    'JOELHO 90 GRAUS, PVC, SOLDÁVEL, DN {d}MM, INSTALADO EM RAMAL OU SUB-RAMAL DE ÁGUA. AF_06/2022',
+    'REGISTRO DE GAVETA BRUTO, LATÃO, ROSCÁVEL, {p}", FORNECIDO E INSTALADO EM RAMAL DE ÁGUA. AF_08/2021',
+    'ELETRODUTO FLEXÍVEL CORRUGADO, PVC, DN {d} MM, PARA CIRCUITOS TERMINAIS. AF_03/2023',
+    'CABO DE COBRE FLEXÍVEL ISOLADO, {s} MM², ANTI-CHAMA 450/750 V, PARA CIRCUITOS TERMINAIS. AF_03/2023',
+    'TOMADA MÉDIA DE EMBUTIR (1 MÓDULO), 2P+T {a} A, INCLUINDO SUPORTE E PLACA. AF_03/2023',
+    'PINTURA LÁTEX ACRÍLICA PREMIUM, APLICAÇÃO MANUAL EM PAREDES, DUAS DEMÃOS. AF_04/2023',
+    'REVESTIMENTO CERÂMICO PARA PISO COM PLACAS TIPO ESMALTADA {c}X{c} CM. AF_02/2023',
+    'PORTA DE MADEIRA PARA PINTURA, SEMI-OCA, {l}X210CM, ESPESSURA DE 3,5CM. AF_12/2019',
+    'CONCRETO FCK = {f}MPA, TRAÇO 1:2,3:2,7 (EM MASSA SECA DE CIMENTO/ AREIA MÉDIA/ BRITA 1). AF_05/2021',
+]
+VARIACOES = {
+    'd': [20, 25, 32, 40, 50], 'p': ['1/2', '3/4', '1'], 's': ['1,5', '2,5', '4,0', '6,0'],
+    'a': [10, 20], 'c': [45, 60, 60], 'l': [60, 70, 80, 90], 'f': [20, 25, 30],
+}
+SECOES = ['ETA', 'Guarita', 'Almoxarifado', 'Laboratório', 'Casa química', 'Oficina', 'Escada', 'Hall']
+CATEGORIAS = ['Serviços preliminares', 'Piso', 'Revestimento', 'Esquadrias', 'Louças, Metais',
+              'Vidro', 'Diversos']
+UNIDADES = ['M', 'UN', 'M²', 'M³', 'm', 'un']
+
+def descricoes_sinapi(rnd, quantidade=60):
+    """Catálogo fixo de descrições SINAPI (as mesmas em todas as planilhas de uma semente)"""
+    catalogo = []
+    while len(catalogo) < quantidade:
+        modelo = rnd.choice(DESCRICOES_SINAPI)
+        catalogo.append(modelo.format(**{k: rnd.choice(v) for k, v in VARIACOES.items()}))
+    return list(dict.fromkeys(catalogo))
+
+def gerar_planilha(caminho, n_linhas, semente=42):
+    """Gera uma planilha de medição sintética com n_linhas de itens"""
+    from openpyxl import Workbook
+
+    rnd = random.Random(semente)
+    catalogo = descricoes_sinapi(rnd)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Medição')
+    ws.append(['MEDIÇÃO MENSAL - SINTÉTICA'])
+    ws.append([f'Obra: benchmark ({n_linhas} linhas)'])
+    ws.append(['Item', 'Código', 'Descrição', 'Und', 'Quant', 'Valor Unit', 'Total'])
+
+    secao = subsecao = item = 0
+    linhas = 0
+    while linhas < n_linhas:
+        sorteio = rnd.random()
+        if sorteio < 0.02 or secao == 0:
+            # Nova seção (obra/edifício) e a linha de total da anterior
+            if secao:
+                ws.append([None, None, f'TOTAL {SECOES[(secao - 1) % len(SECOES)].upper()}',
+                           None, None, None, round(rnd.uniform(1e4, 1e6), 2)])
+                linhas += 1
+            secao += 1
+            subsecao = 0
+            ws.append([str(secao), None, SECOES[(secao - 1) % len(SECOES)], None, None, None, None])
+        elif sorteio < 0.08:
+            subsecao += 1
+            item = 0
+            ws.append([f'{secao}.{subsecao}', None, rnd.choice(CATEGORIAS), None, None, None,
+                       round(rnd.uniform(1e3, 1e5), 2)])
+        else:
+            item += 1
+            if rnd.random() < 0.85:
+                descricao = rnd.choice(catalogo)
+            else:
+                descricao = f'ITEM COMPLEMENTAR {rnd.randint(1, n_linhas // 10 + 10)} CONFORME PROJETO'
+            quantidade = round(rnd.uniform(0.5, 200), 2) if rnd.random() > 0.03 else None
+            unitario = round(rnd.uniform(2, 900), 2)
+            total = round(unitario * quantidade, 2) if quantidade and rnd.random() > 0.05 else 0
+            ws.append([f'{secao}.{subsecao}.{item}', str(rnd.randint(80000, 105000)), descricao,
+                       rnd.choice(UNIDADES) if rnd.random() > 0.03 else None, quantidade, unitario, total])
+        linhas += 1
+
+    ws.append([None, None, 'TOTAL GERAL', None, None, None, round(rnd.uniform(1e6, 1e7), 2)])
+    wb.save(caminho)
+
+def obter_planilha(n_linhas, semente=42):
+    """Caminho da planilha sintética (gerada na primeira vez e reaproveitada depois)"""
+    os.makedirs(PASTA_DADOS, exist_ok=True)
+    caminho = os.path.join(PASTA_DADOS, f'medicao_v{VERSAO_GERADOR}_s{semente}_{n_linhas}.xlsx')
+    if not os.path.exists(caminho):
+        print(f"Gerando planilha sintética com {n_linhas} linhas...")
+        temporario = f'{caminho}.{os.getpid()}.tmp'
+        gerar_planilha(temporario, n_linhas, semente)
+        os.replace(temporario, caminho)
+    return caminho
+
+def cronometrar(funcao, *args, **kwargs):
+    inicio = time.perf_counter()
+    resultado = funcao(*args, **kwargs)
+    return time.perf_counter() - inicio, resultado
+
+def medir(caminho_planilha, repeticoes, pasta_trabalho):
+    """Tempos (s) de cada etapa em `repeticoes` execuções"""
+    tempos = {etapa: [] for etapa in ETAPAS}
+    itens_agrupados = []
+    for _ in range(repeticoes):
+        # Silenciar os prints do processamento
+        with contextlib.redirect_stdout(io.StringIO()):
+            tempo, itens_agrupados = cronometrar(processar_planilha_para_cotacao, caminho_planilha)
+            tempos['processar'].append(tempo)
+            tempo, _ = cronometrar(criar_html_cotacao, itens_agrupados)
+            tempos['html'].append(tempo)
+            tempo, _ = cronometrar(salvar_csv_cotacao, itens_agrupados,
+                                   os.path.join(pasta_trabalho, 'bench.csv'))
+            tempos['csv'].append(tempo)
+    return tempos, len(itens_agrupados)
+
+def resumir(tempos):
+    return {etapa: {'min': min(valores), 'mediana': statistics.median(valores)}
+            for etapa, valores in tempos.items()}
+
+# Diferenças menores que isso (em segundos) são ruído de medição, não regressão
+DIFERENCA_MINIMA = 0.005
+
+def comparar(resultados, baseline, tolerancia):
+    """Imprime a variação em relação ao baseline; retorna True se alguma etapa piorou além da tolerância"""
+    piorou = False
+    print(f"\n{'Linhas':>8} | {'Etapa':<10} | {'Baseline (s)':>12} | {'Atual (s)':>10} | {'Variação':>9}")
+    print('-' * 62)
+    for linhas, resultado in resultados.items():
+        anterior = baseline.get('resultados', {}).get(linhas)
+        if not anterior:
+            continue
+        for etapa in ETAPAS:
+            antes = anterior['tempos'][etapa]['min']
+            agora = resultado['tempos'][etapa]['min']
+            variacao = (agora - antes) / antes if antes else 0.0
+            alerta = ' ⚠️' if variacao > tolerancia and agora - antes > DIFERENCA_MINIMA else ''
+            piorou = piorou or bool(alerta)
+            print(f"{linhas:>8} | {etapa:<10} | {antes:>12.3f} | {agora:>10.3f} | {variacao:>+8.1%}{alerta}")
+    return piorou
+
+def criar_parser_argumentos():
+    parser = argparse.ArgumentParser(description='Benchmark das etapas com planilhas sintéticas.')
+    parser.add_argument('--linhas', nargs='+', type=int, default=TAMANHOS_PADRAO,
+                        help='tamanhos das planilhas (padrão: 1000 10000 100000)')
+    parser.add_argument('--repeticoes', type=int, default=3,
+                        help='execuções por tamanho; o baseline usa o menor tempo (padrão: 3)')
+    parser.add_argument('--semente', type=int, default=42, help='semente das planilhas sintéticas')
+    parser.add_argument('--baseline', default=BASELINE_PADRAO,
+                        help='arquivo JSON do baseline (padrão: benchmarks/baseline_pipeline.json)')
+    parser.add_argument('--salvar', action='store_true', help='grava os resultados como novo baseline')
+    parser.add_argument('--tolerancia', type=float, default=0.2,
+                        help='piora relativa tolerada antes de acusar regressão (padrão: 0.2 = 20%%)')
+    return parser
+
+def main(argv=None):
+    args = criar_parser_argumentos().parse_args(argv)
+    planilhas = {n: obter_planilha(n, args.semente) for n in args.linhas}
+
+    resultados = {}
+    print(f"{'Linhas':>8} | {'Itens':>6} | {'processar (s)':>13} | {'html (s)':>9} | {'csv (s)':>8}")
+    print('-' * 58)
+    with tempfile.TemporaryDirectory() as pasta_trabalho:
+        # Rodar numa pasta vazia: sem imagens/checklist da pasta atual influenciando o HTML
+        pasta_original = os.getcwd()
+        os.chdir(pasta_trabalho)
+        try:
+            for n, caminho in planilhas.items():
+                tempos, itens = medir(caminho, args.repeticoes, pasta_trabalho)
+                resumo = resumir(tempos)
+                resultados[str(n)] = {'itens': itens, 'tempos': resumo}
+                print(f"{n:>8} | {itens:>6} | {resumo['processar']['min']:>13.3f} | "
+                      f"{resumo['html']['min']:>9.3f} | {resumo['csv']['min']:>8.3f}")
+        finally:
+            os.chdir(pasta_original)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    piorou = comparar(resultados, baseline, args.tolerancia) if baseline else False
+
+    if args.salvar or baseline is None:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({
+                'gerado_em': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'plataforma': platform.platform(),
+                'repeticoes': args.repeticoes,
+                'semente': args.semente,
+                'resultados': resultados,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"\n✅ Baseline salvo: {args.baseline}")
+
+    return 1 if piorou else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,131 @@
+"""Testes do classificador, do agrupamento e dos valores em reais
+
+Uso:
+    python -m pytest -q
+"""
+import os
+import sys
+from collections import Counter
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import agrupar_itens_cotacao as cotacao  # noqa: E402
+
+DESCRICOES = [
+    'Piso',                                                  # categoria genérica
+    'Esquadrias, Vidro',                                     # lista de categorias
+    'Tomada simples',                                        # poucas palavras, sem especificação
+    'Porta de madeira 80x210 cm',                            # item final
+    'Porta de madeira 80x210 cm',                            # item final sem valor
+    'TUBO PVC SOLDÁVEL DN 25 MM, INSTALADO EM RAMAL AF_06',  # item final
+    'Piso',                                                  # categoria genérica com valor 0
+]
+VALORES = [100.0, 50.0, 30.0, 250.0, 0.0, 12.5, 0.0]
+
+def brutos(descricoes, valores, unidades=None, quantidades=None):
+    unidades = unidades or ['un'] * len(descricoes)
+    quantidades = quantidades or [1.0] * len(descricoes)
+    return cotacao.ItensBrutos.de_colunas(descricoes, valores, quantidades, unidades)
+
+def test_classificar_motivos():
+    mascara, motivos = cotacao.classificador_itens.classificar(pd.Series(DESCRICOES), pd.Series(VALORES))
+
+    assert mascara.tolist() == [False, False, False, True, False, True, False]
+    assert motivos.tolist() == [
+        cotacao.MOTIVO_CATEGORIA, cotacao.MOTIVO_LISTA_CATEGORIAS, cotacao.MOTIVO_SEM_DETALHES,
+        cotacao.MOTIVO_MANTIDO, cotacao.MOTIVO_SEM_VALOR, cotacao.MOTIVO_MANTIDO,
+        cotacao.MOTIVO_CATEGORIA,
+    ]
+
+def test_classificar_item_igual_ao_vetorizado():
+    _, motivos = cotacao.classificador_itens.classificar(pd.Series(DESCRICOES), pd.Series(VALORES))
+    for desc, valor, motivo in zip(DESCRICOES, VALORES, motivos.tolist()):
+        manter, motivo_item = cotacao.classificador_itens.classificar_item(desc, valor)
+        assert motivo_item == motivo
+        assert manter == (motivo == cotacao.MOTIVO_MANTIDO)
+
+def test_classificar_brutos_igual_a_classificar():
+    mascara, motivos = cotacao.classificador_itens.classificar(pd.Series(DESCRICOES), pd.Series(VALORES))
+    mascara_brutos, motivos_brutos = cotacao.classificador_itens.classificar_brutos(brutos(DESCRICOES, VALORES))
+
+    assert mascara_brutos.tolist() == mascara.tolist()
+    assert motivos_brutos.tolist() == motivos.tolist()
+
+def test_categorias_personalizadas():
+    classificador = cotacao.ClassificadorItens(categorias=['telhado'])
+    assert classificador.motivo_descricao('Telhado') == cotacao.MOTIVO_CATEGORIA
+    assert classificador.motivo_descricao('Piso') == cotacao.MOTIVO_SEM_DETALHES
+
+def test_agrupar_unidade_mais_frequente():
+    descricoes = ['Cabo flexível 2,5 mm'] * 3
+    itens = brutos(descricoes, [10.0, 10.0, 10.0], unidades=['m', 'un', 'un'])
+
+    agrupados = cotacao.agrupar_itens(itens, Counter(descricoes))
+
+    assert agrupados[0]['unidade'] == 'un'
+
+def test_agrupar_empate_de_unidade_fica_com_a_primeira():
+    descricoes = ['Cabo flexível 2,5 mm'] * 4 + ['Disjuntor bipolar 20 A'] * 2
+    unidades = ['m', 'un', 'un', 'm', 'pç', 'un']
+    itens = brutos(descricoes, [10.0] * 6, unidades=unidades)
+
+    agrupados = {item['descricao']: item for item in cotacao.agrupar_itens(itens, Counter(descricoes))}
+
+    assert agrupados['Cabo flexível 2,5 mm']['unidade'] == 'm'
+    assert agrupados['Disjuntor bipolar 20 A']['unidade'] == 'pç'
+
+def test_agrupar_ordem_e_valores():
+    descricoes = ['Item A com detalhes', 'Item B com detalhes', 'Item B com detalhes', 'Item A com detalhes']
+    itens = brutos(descricoes, [10.0, 5.0, 0.0, 20.0], quantidades=[1.0, 2.0, 3.0, 4.0])
+    contador = Counter(descricoes + ['Item B com detalhes'])
+
+    agrupados = cotacao.agrupar_itens(itens, contador)
+
+    assert [item['descricao'] for item in agrupados] == ['Item B com detalhes', 'Item A com detalhes']
+    item_b, item_a = agrupados
+    assert item_b['quantidade'] == 3            # Do contador (inclui as ocorrências com valor 0)
+    assert item_b['quantidade_total'] == 5.0
+    assert item_b['valores'] == [5.0]           # Valor 0 não entra na média
+    assert item_a['valor_total'] == 30.0
+    assert item_a['valor_unitario'] == 15.0
+    assert item_a['valores'] == [10.0, 20.0]
+
+def test_agrupar_sem_valor_nao_forma_grupo():
+    itens = brutos(['Item sem valor algum'], [0.0])
+    assert cotacao.agrupar_itens(itens, Counter()) == []
+    assert cotacao.agrupar_itens(cotacao.ItensBrutos.vazio(), Counter()) == []
+
+def test_totais_sem_erro_de_ponto_flutuante():
+    # Em float, somar 43.155 mil vezes não dá exatamente 43155.0
+    descricoes = ['Item repetido muitas vezes'] * 1000
+    itens = brutos(descricoes, [43.155] * 1000)
+
+    agrupados = cotacao.agrupar_itens(itens, Counter(descricoes))
+
+    assert sum([43.155] * 1000) != 43155.0
+    assert agrupados[0]['valor_total'] == 43155.0
+    assert cotacao.somar_reais([0.1] * 10) == 1.0
+
+def test_totais_preservam_fracoes_de_centavo():
+    # Três parcelas de 0.004 somam 0.012: arredondar cada uma antes daria 0.00
+    descricoes = ['Item com fração de centavo'] * 3
+    itens = brutos(descricoes, [0.004] * 3)
+
+    agrupados = cotacao.agrupar_itens(itens, Counter(descricoes))
+
+    assert agrupados[0]['valor_total'] == 0.012
+    assert cotacao.formatar_reais(agrupados[0]['valor_total']) == 'R$ 0.01'
+
+@pytest.mark.parametrize('valor, esperado', [
+    (0.125, 'R$ 0.13'),
+    (0.005, 'R$ 0.01'),
+    (638.195, 'R$ 638.20'),
+    (2.675, 'R$ 2.68'),
+    (1234567.891, 'R$ 1,234,567.89'),
+    (0, 'R$ 0.00'),
+])
+def test_formatar_reais_metade_para_cima(valor, esperado):
+    assert cotacao.formatar_reais(valor) == esperado
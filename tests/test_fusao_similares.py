@@ -0,0 +1,98 @@
+"""Testes da fusão de descrições quase iguais (--fundir-similares)
+
+Uso:
+    python -m pytest -q
+"""
+import os
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import agrupar_itens_cotacao as cotacao  # noqa: E402
+
+def grupos_de(descricoes, limiar=cotacao.LIMIAR_SIMILARIDADE):
+    """Grupos com mais de uma descrição (conjuntos, para comparar sem depender da ordem)"""
+    return [set(grupo) for grupo in cotacao.agrupar_descricoes_similares(descricoes, limiar) if len(grupo) > 1]
+
+def brutos(descricoes, valores=None, quantidades=None):
+    valores = valores or [10.0] * len(descricoes)
+    quantidades = quantidades or [1.0] * len(descricoes)
+    return cotacao.ItensBrutos.de_colunas(descricoes, valores, quantidades, ['un'] * len(descricoes))
+
+def test_numeros_diferentes_nunca_sao_fundidos():
+    descricoes = [
+        'TUBO PVC SOLDÁVEL DN 25 MM, FORNECIDO E INSTALADO EM RAMAL DE ÁGUA. AF_06/2014',
+        'TUBO PVC SOLDÁVEL DN 32 MM, FORNECIDO E INSTALADO EM RAMAL DE ÁGUA. AF_06/2014',
+        'TUBO PVC SOLDÁVEL DN 25 MM, FORNECIDO E INSTALADO EM RAMAL DE ÁGUA. AF_12/2014',
+        'TUBO PVC SOLDÁVEL DN 25 MM, FORNECIDO E INSTALADO EM RAMAL DE ÁGUA. AF_06/2015',
+    ]
+    assert grupos_de(descricoes) == []
+    assert grupos_de(descricoes, 0) == []
+
+def test_variantes_de_espaco_caixa_e_acento_sao_fundidas():
+    descricoes = [
+        'Tubo PVC soldável DN 25 mm AF_06/2014',
+        'Tubo PVC soldável DN 25 mm AF_06/2014 ',
+        'TUBO PVC SOLDÁVEL DN 25 MM AF_06/2014',
+        'Tubo  PVC soldavel DN 25 mm AF_06/2014',
+        'Registro de gaveta bruto 3/4"',
+    ]
+    assert grupos_de(descricoes) == [set(descricoes[:4])]
+
+def test_pequena_variacao_de_texto_e_fundida():
+    descricoes = ['Caixa sifonada PVC 150x150x50 mm com grelha branca',
+                  'Caixa sifonada PVC 150x150x50 mm com grelha brancas']
+    assert grupos_de(descricoes) == [set(descricoes)]
+
+def test_canonica_e_a_mais_frequente():
+    descricoes = ['Tubo PVC soldável DN 25 mm', 'TUBO PVC SOLDÁVEL DN 25 MM', 'TUBO PVC SOLDÁVEL DN 25 MM']
+    contador = Counter(descricoes)
+
+    itens, contador_fundido, fusoes = cotacao.fundir_itens_similares(brutos(descricoes), contador)
+
+    assert fusoes == {'TUBO PVC SOLDÁVEL DN 25 MM': ['Tubo PVC soldável DN 25 mm']}
+    assert set(itens.descricoes_itens().tolist()) == {'TUBO PVC SOLDÁVEL DN 25 MM'}
+    assert contador_fundido == Counter({'TUBO PVC SOLDÁVEL DN 25 MM': 3})
+
+def test_empate_de_frequencia_fica_com_a_primeira_vista():
+    descricoes = ['Tubo PVC soldável DN 25 mm ', 'Tubo PVC soldável DN 25 mm', 'TUBO PVC SOLDÁVEL DN 25 MM']
+
+    _, _, fusoes = cotacao.fundir_itens_similares(brutos(descricoes), Counter(descricoes))
+
+    assert list(fusoes) == ['Tubo PVC soldável DN 25 mm ']
+
+def test_contagens_e_quantidades_somadas_entre_variantes():
+    descricoes = ['Tubo PVC soldável DN 25 mm', 'TUBO PVC SOLDÁVEL DN 25 MM',
+                  'Tubo PVC soldavel DN 25 mm', 'TUBO PVC SOLDÁVEL DN 25 MM']
+    itens = brutos(descricoes, valores=[10.0, 20.0, 30.0, 40.0], quantidades=[1.0, 2.0, 3.0, 4.0])
+    # Ocorrências com valor 0 ficam só no contador e também são somadas
+    contador = Counter(descricoes + ['Tubo PVC soldavel DN 25 mm'])
+
+    agrupados = cotacao.filtrar_e_agrupar(itens, contador, fundir_similares=cotacao.LIMIAR_SIMILARIDADE)
+
+    assert len(agrupados) == 1
+    item = agrupados[0]
+    assert item['descricao'] == 'TUBO PVC SOLDÁVEL DN 25 MM'
+    assert item['quantidade'] == 5
+    assert item['quantidade_total'] == 10.0
+    assert item['valor_total'] == 100.0
+    assert item['variantes'] == ['Tubo PVC soldável DN 25 mm', 'Tubo PVC soldavel DN 25 mm']
+
+def test_sem_fusao_sem_variantes():
+    descricoes = ['Tubo PVC soldável DN 25 mm', 'TUBO PVC SOLDÁVEL DN 25 MM']
+
+    agrupados = cotacao.filtrar_e_agrupar(brutos(descricoes), Counter(descricoes))
+
+    assert len(agrupados) == 2
+    assert all('variantes' not in item for item in agrupados)
+
+def test_limiar_zero_e_respeitado():
+    descricoes = ['Cabo de cobre flexível 2,5 mm preto', 'Cabo de cobre flexível 2,5 mm azul']
+
+    assert grupos_de(descricoes) == []
+    assert grupos_de(descricoes, 0) == [set(descricoes)]
+
+    agrupados = cotacao.filtrar_e_agrupar(brutos(descricoes), Counter(descricoes), fundir_similares=0)
+    assert len(agrupados) == 1
+    assert agrupados[0]['quantidade'] == 2
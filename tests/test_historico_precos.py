@@ -0,0 +1,90 @@
+"""Testes do histórico de preços em SQLite (HistoricoPrecos)
+
+Uso:
+    python -m pytest -q
+"""
+import os
+import sys
+from datetime import date, datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import agrupar_itens_cotacao as cotacao  # noqa: E402
+
+DESCRICAO = 'Tubo PVC soldável DN 25 mm'
+
+def itens(valor_unitario, descricao=DESCRICAO):
+    return [{'descricao': descricao, 'unidade': 'm', 'quantidade': 2, 'quantidade_total': 10.0,
+             'valor_unitario': valor_unitario, 'valor_total': valor_unitario * 2}]
+
+def planilha(pasta, nome, conteudo):
+    """Arquivo qualquer: o histórico só usa o hash do conteúdo e o nome"""
+    caminho = pasta / nome
+    caminho.write_bytes(conteudo)
+    return str(caminho)
+
+@pytest.fixture
+def historico(tmp_path):
+    historico = cotacao.HistoricoPrecos(str(tmp_path / 'historico.sqlite'))
+    yield historico
+    historico.fechar()
+
+def test_precos_anteriores_usa_a_ultima_data_anterior(historico):
+    historico.registrar(itens(10.0), data='2026-08-01')
+    historico.registrar(itens(12.0), data='2026-09-01')
+
+    anteriores = historico.precos_anteriores(itens(13.0), '2026-10-01')
+
+    assert anteriores[DESCRICAO]['valor_unitario'] == 12.0
+    assert anteriores[DESCRICAO]['data'] == '2026-09-01'
+
+def test_precos_anteriores_ignora_a_mesma_data(historico):
+    historico.registrar(itens(10.0), data='2026-09-01')
+    historico.registrar(itens(11.0), data='2026-10-01')   # Outra planilha na mesma data
+
+    anteriores = historico.precos_anteriores(itens(13.0), '2026-10-01')
+
+    assert anteriores[DESCRICAO]['valor_unitario'] == 10.0
+
+def test_precos_anteriores_ignora_a_execucao_atual(historico):
+    execucao_id = historico.registrar(itens(13.0), data='2026-10-01')
+
+    assert historico.precos_anteriores(itens(13.0), '2026-10-01', execucao_id) == {}
+    assert historico.precos_anteriores(itens(13.0), '2026-11-01', execucao_id) == {}
+
+def test_precos_anteriores_compara_descricoes_normalizadas(historico):
+    historico.registrar(itens(10.0, 'TUBO  PVC SOLDÁVEL DN 25 MM '), data='2026-09-01')
+
+    anteriores = historico.precos_anteriores(itens(13.0), '2026-10-01')
+
+    assert anteriores[DESCRICAO]['valor_unitario'] == 10.0
+
+def test_registrar_mesma_planilha_substitui_o_registro(historico, tmp_path):
+    caminho = planilha(tmp_path, 'Medicao.xlsx', b'medicao de setembro')
+    historico.registrar(itens(10.0), caminho, '2026-09-01')
+    historico.registrar(itens(11.0), caminho, '2026-09-02')
+
+    assert [(h['data'], h['valor_unitario']) for h in historico.historico(DESCRICAO)] == [('2026-09-02', 11.0)]
+    assert historico.conexao.execute('SELECT COUNT(*) FROM execucoes').fetchone()[0] == 1
+
+def test_registrar_planilhas_diferentes_acumula(historico, tmp_path):
+    historico.registrar(itens(10.0), planilha(tmp_path, 'A.xlsx', b'a'), '2026-09-01')
+    historico.registrar(itens(11.0), planilha(tmp_path, 'B.xlsx', b'b'), '2026-09-01')
+
+    assert [h['planilha'] for h in historico.historico(DESCRICAO)] == ['A.xlsx', 'B.xlsx']
+
+def test_historico_em_ordem_de_data(historico):
+    # Registradas fora de ordem; datas como str, date e datetime
+    historico.registrar(itens(12.0), data=date(2026, 10, 1))
+    historico.registrar(itens(10.0), data='2026-08-01')
+    historico.registrar(itens(11.0), data=datetime(2026, 9, 1, 15, 30))
+
+    assert [(h['data'], h['valor_unitario']) for h in historico.historico(DESCRICAO)] == [
+        ('2026-08-01', 10.0), ('2026-09-01', 11.0), ('2026-10-01', 12.0),
+    ]
+
+def test_data_fora_do_formato_iso(historico):
+    with pytest.raises(ValueError):
+        historico.registrar(itens(10.0), data='01/10/2026')
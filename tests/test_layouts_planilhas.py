@@ -0,0 +1,105 @@
+"""Testes do arquivo de layouts manuais com o cache de resultados e o armazém
+
+Uso:
+    python -m pytest -q
+"""
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import agrupar_itens_cotacao as cotacao  # noqa: E402
+
+# (descrição, unidade, quantidade, valor unitário, total)
+LINHAS = [
+    ('TUBO PVC SOLDÁVEL DN 25 MM, FORNECIDO E INSTALADO', 'm', 2, 10.0, 25.0),
+    ('TUBO PVC SOLDÁVEL DN 25 MM, FORNECIDO E INSTALADO', 'm', 3, 10.0, 35.0),
+    ('REGISTRO DE GAVETA BRUTO 3/4", FORNECIDO E INSTALADO', 'un', 1, 40.0, 45.0),
+]
+TOTAL_COLUNA_TOTAL = 105.0
+TOTAL_COLUNA_UNITARIO = 60.0
+# Corrige a detecção, que usa a coluna 'Total'
+LAYOUT_UNITARIO = {'Medicao*.xlsx': {
+    'linha_cabecalho': 1,
+    'colunas': {'descricao': 'Descrição', 'total': 'Valor Unit', 'unidade': 'Und', 'quantidade': 'Quant'},
+}}
+
+@pytest.fixture
+def pasta(tmp_path):
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    ws = wb.active
+    ws.append(['Item', 'Descrição', 'Und', 'Quant', 'Valor Unit', 'Total'])
+    for i, linha in enumerate(LINHAS, 1):
+        ws.append([i, *linha])
+    wb.save(tmp_path / 'Medicao.xlsx')
+    yield tmp_path
+    cotacao.configurar_leitura()
+
+def nova_execucao(pasta, layouts=None):
+    """Como uma nova execução do script: o arquivo manual é lido de novo"""
+    caminho_layouts = pasta / 'layouts_planilhas.json'
+    if layouts is None:
+        caminho_layouts.unlink(missing_ok=True)
+    else:
+        caminho_layouts.write_text(json.dumps(layouts), encoding='utf-8')
+    cotacao.configurar_leitura(layouts_manuais=str(caminho_layouts))
+
+def total(itens_agrupados):
+    return cotacao.somar_reais([item['valor_total'] for item in itens_agrupados])
+
+def test_assinatura_manual(pasta):
+    planilha = str(pasta / 'Medicao.xlsx')
+    nova_execucao(pasta)
+    assert cotacao.layouts_planilhas.assinatura_manual(planilha) == ''
+
+    nova_execucao(pasta, {'Outra*.xlsx': LAYOUT_UNITARIO['Medicao*.xlsx']})
+    assert cotacao.layouts_planilhas.assinatura_manual(planilha) == ''
+
+    nova_execucao(pasta, LAYOUT_UNITARIO)
+    assinatura = cotacao.layouts_planilhas.assinatura_manual(planilha)
+    assert assinatura
+
+    # Entradas por impressão digital podem valer para qualquer planilha
+    nova_execucao(pasta, dict(LAYOUT_UNITARIO, **{'0123456789abcdef': {'linha_cabecalho': 2}}))
+    assert cotacao.layouts_planilhas.assinatura_manual(planilha) not in ('', assinatura)
+
+def test_layout_manual_invalida_cache_de_resultados(pasta):
+    planilha = str(pasta / 'Medicao.xlsx')
+    cache = cotacao.CacheResultados(str(pasta / 'cache'))
+
+    nova_execucao(pasta)
+    assert total(cotacao.processar_planilha_com_cache(planilha, cache)) == TOTAL_COLUNA_TOTAL
+
+    nova_execucao(pasta, LAYOUT_UNITARIO)
+    assert total(cotacao.processar_planilha_com_cache(planilha, cache)) == TOTAL_COLUNA_UNITARIO
+
+    # Sem a correção, volta o resultado original (ainda em cache)
+    nova_execucao(pasta)
+    assert total(cotacao.processar_planilha_com_cache(planilha, cache)) == TOTAL_COLUNA_TOTAL
+
+def test_layout_manual_invalida_armazem(pasta):
+    planilha = str(pasta / 'Medicao.xlsx')
+    armazem = cotacao.ArmazemItensBrutos(str(pasta / 'itens_brutos.sqlite'))
+    try:
+        for todas_abas in (False, True):
+            nova_execucao(pasta)
+            itens, _ = armazem.obter_ou_extrair(planilha, todas_abas)
+            assert cotacao.somar_reais(itens.valores_fixos / cotacao.ESCALA_VALORES) == TOTAL_COLUNA_TOTAL
+
+            nova_execucao(pasta, LAYOUT_UNITARIO)
+            itens, _ = armazem.obter_ou_extrair(planilha, todas_abas)
+            assert cotacao.somar_reais(itens.valores_fixos / cotacao.ESCALA_VALORES) == TOTAL_COLUNA_UNITARIO
+
+            # Guardados com a correção: lidos do armazém, sem reler a planilha
+            hash_planilha = cotacao.hash_arquivo(planilha)
+            aba = cotacao.listar_abas(planilha)[0] if todas_abas else ''
+            assinatura = cotacao.layouts_planilhas.assinatura_manual(planilha)
+            assert armazem.obter(hash_planilha, aba, assinatura) is not None
+            assert armazem.obter(hash_planilha, aba) is None
+    finally:
+        armazem.fechar()